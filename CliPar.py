@@ -1,8 +1,16 @@
-import csv, argparse
+import csv, argparse, calendar, glob, os, sys, time, hashlib, json
+import bz2, gzip, heapq, io
+import cPickle
+import multiprocessing
 from collections import Counter
+from itertools import compress, islice
 
 import numpy as np
-from math import floor
+from math import floor, ceil, log, sqrt, sin, cos, asin, atan2, radians, degrees
+try:
+    import pyarrow.feather, pyarrow.ipc, pyarrow.parquet #optional, for Parquet and Arrow input
+except ImportError:
+    pyarrow = None
 
 #Created by Dylan Quinn (quinnd@uidaho.edu, dylansquinn@gmail.com)
 
@@ -27,7 +35,93 @@ Output ('.par'):
 A cligen '.par' file describing monthly climate parameters as mean, std dev, and skewedness.
 
 *Headder information including Station Name, Station Number, Latt, Long, and Elevation may
-    require manual editing after the file is created.
+    require manual editing after the file is created, unless the station is in a catalog (-C).
+
+Engines:
+rows        the original per-row pass over csv.DictReader (default)
+columnar    loads the columns into typed numpy arrays once and computes the daily
+            and monthly values with vectorized group-by passes; the '.par' written is
+            identical to the one from the per-row pass
+streaming   the per-row pass with constant memory: each month (and wind direction) keeps a
+            count, running mean and variance, and a bounded log-bucket sketch for the median.
+            Means and std devs match the other engines to rounding; each median is within 0.5%
+            of the exact one, which moves a skew (3*(mean-median)/std) by at most
+            0.015*median/std
+
+Library use:
+    import CliPar
+    acc = CliPar.accumulate('station.csv')              #or an open file, or a dict of arrays
+    params = CliPar.compute_params(acc, 'STATION')      #Parameters: header and monthly values
+    with open('station.par', 'w') as o:
+        CliPar.write_par(o, params)
+or all three in one with CliPar.make_par('station.csv', 'station.par').
+
+Batch mode (-b DIR or -b "GLOB"):
+Writes a '.par' for every station '.csv' using a pool of worker processes (-w), along with a
+manifest '.csv' giving each station's status, row count, years of record and wall time.
+
+Parallel single station (-j N, rows and streaming engines):
+Splits the records at day boundaries after a dry spell and runs the per-row pass over the pieces in
+N worker processes; the pieces are merged (storms crossing a split are stitched back together) into
+exactly the values of one pass over the whole record.
+
+Incremental updates (-u, rows and streaming engines):
+The state of the per-row pass is saved next to the '.par' ('.par.state'). A later run with -u
+carries on from it, processing only the records newer than the last one seen, so new data can be
+added to a '.par' without going over the whole record again. The station keeps the name of the first
+run's input.
+
+Run reports (-p):
+Writes a JSON report next to the '.par' ('.par.json') with the wall time and rows per second of each
+stage, and (rows and streaming engines) a count of each kind of record or value the per-row pass had
+to leave out or work around (blank or unparseable fields, wind directions out of range, one step
+storms, ...; see REJECTED), so bad data can be told apart from slow code across many stations.
+
+Storms (-s, -g GAP ...):
+-s writes a table of the storms next to the '.par' ('.par.storms.csv'): start, end, duration, depth,
+peak intensities, peak offset and time to peak of each storm (see StormTable). A storm ends after
+an hour of dry time steps (4 of 15 minutes) by default; -g writes a '.par' for each of several dry
+gaps (OUTPUT_g<gap>.par, and its storm table with -s) from one pass over the records.
+
+Record interval (-t MINUTES):
+The records are taken to be the most common time apart among the first ones unless -t says otherwise
+(1 to 60 minutes). 1, 3 and 5 minute records are added up to 15 minutes as they're read, with no
+file written in between: precip totals, means of temp, humid, srad and ws, and the mean wind
+direction (see Resampler). Other intervals are worked on as they are, with the 30 minute and 6 hour
+precip windows and the dry gap between storms (an hour) counted in their time steps; with hourly
+records the largest 30 minute precip (MX .5 P, TP5) can only be the largest hourly one, at its rate.
+
+Compressed and columnar input:
+A '.csv.gz' or '.csv.bz2' is decompressed as it's read, in large blocks, with no file written in
+between (though it can't be split with -j). With pyarrow installed, the columnar engine also reads
+Parquet ('.parquet') and Arrow ('.arrow', '.feather') files with the same columns straight into its
+arrays; datetime there can be a timestamp as well as text.
+
+Station catalog (-C FILE):
+A '.csv' of station, name, station_id, latitude, longitude, elevation (ft) and (optionally) sections
+for each station (see StationCatalog). The header of a station's '.par' comes from its row, and each
+interpolated section lists the nearest stations with that data and their weighting factors (inverse
+distance squared), found through a k-d tree of the stations, so a batch of any size looks each one
+up quickly. A station that isn't in the catalog keeps the default header.
+
+Bootstrap confidence intervals (-B REPLICATES):
+Writes how far each monthly parameter (but the wind) can be trusted next to the '.par'
+('.par.ci.csv'): its value and the 95% interval and std error of its values over replicates of the
+record made of whole years drawn at random, with replacement (see bootstrap_params). The daily
+series are summed by month and year once and the replicates worked out from those together, over
+-w worker processes; the years drawn come from a fixed seed, so a rerun gives the same intervals.
+The intervals always come from the exact columnar series, whichever engine writes the '.par', so -B
+can't be used with the streaming engine, whose approximate medians could disagree with them.
+
+Moving windows (-W YEARS, columnar engine):
+Writes a '.par' for every YEARS long window of calendar years of the record, each a year after the
+last (OUTPUT_<first>-<last>.par), instead of one for the whole record, for trend studies. The record
+is read and summed by month and year once, and every window is worked out from running totals of
+those sums (see window_params), so the windows of a long record take little longer than its '.par'.
+
+Input cache (-c DIR, columnar engine):
+The parsed and unit converted columns of each input are saved in DIR as '.npy' files, and later
+runs on an unchanged input memory map them instead of parsing the '.csv' again.
 
 
 References:
@@ -37,6 +131,10 @@ Cligen Parameter input file documentation (accessed 03/01/2017) -
 '''
 
 
+COLUMNS = ('datetime', 'temp', 'humid', 'srad', 'ws', 'prcp', 'wdir')
+DATE_COLUMNS = ('year', 'month', 'day', 'minute') #the datetime column once parsed
+DIRECTIONS = ('N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW')
+
 
 def windDirection(deg):
     if deg >=0.0 and deg < 11.25:  
@@ -86,89 +184,662 @@ def dateparse(datetime):
     except:
         pass
 
+SECTORS = dict((key, i) for i, key in enumerate(DIRECTIONS))
+NA_SECTOR = len(DIRECTIONS)
+SECTOR_BOUNDS = np.arange(11.25, 360.0, 22.5) #lower bound of each sector after N
 
-if __name__ == "__main__":
+def windSectors(degs):
+    '''Vectorized windDirection: the index into DIRECTIONS of each direction in degs (degrees from N),
+    with the same bounds (348.75 to 360 is N again), and NA_SECTOR where it's out of range or nan'''
+    degs = np.asarray(degs, dtype=float)
+    with np.errstate(invalid='ignore'):
+        ok = (degs >= 0.0) & (degs <= 360.0)
+    return np.where(ok, np.searchsorted(SECTOR_BOUNDS, degs, side='right') % len(DIRECTIONS), NA_SECTOR)
+
+
+class WindRose(object):
+    '''Wind speeds binned by month and direction: cells[month - 1][sector], where sector indexes
+    DIRECTIONS. Each cell is a list, or whatever sample() returns, for speeds added one at a time
+    (append), or an array for speeds added as arrays (add). A reading without a direction (NA_SECTOR)
+    only counts towards its month's total.'''
     
-    #treat numpy errors as real errors
-    np.seterr(all='raise')
+    def __init__(self, sample=list):
+        self.cells = [[sample() for key in DIRECTIONS] for m in range(12)]
+        self.total = [0]*12
     
-        #fin = "sotonera.csv"
-    fin = "test.csv"
-    fout = "test.par"
+    def append(self, month, sector, speed):
+        if sector != NA_SECTOR:
+            self.cells[month - 1][sector].append(speed)
+        self.total[month - 1] += 1
     
+    def add(self, months, sectors, speeds):
+        '''Adds arrays of readings, keeping the order of the speeds within each cell'''
+        months = np.asarray(months, dtype=int)
+        sectors = np.asarray(sectors, dtype=int)
+        speeds = np.asarray(speeds, dtype=float)
+        for i, count in enumerate(np.bincount(months - 1, minlength=12)):
+            self.total[i] += int(count)
+        ok = sectors != NA_SECTOR
+        parts = _group(speeds[ok], (months[ok] - 1)*len(DIRECTIONS) + sectors[ok], 12*len(DIRECTIONS))
+        for i, part in enumerate(parts):
+            m, s = divmod(i, len(DIRECTIONS))
+            cell = self.cells[m][s]
+            self.cells[m][s] = np.concatenate((np.asarray(cell, dtype=float), part)) if len(cell) else part
     
-   #Create argument parser
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-i', '--input', help='Input 15 minute climate data file name (\'*.csv\')')
-    parser.add_argument('-o', '--output', help='Output parameter file name (\'*.par\')')
-    args = parser.parse_args()
+    def merge(self, other):
+        '''Adds the readings of other, which come after these'''
+        for m in range(12):
+            for s in range(len(DIRECTIONS)):
+                self.cells[m][s] = _concat(self.cells[m][s], other.cells[m][s])
+            self.total[m] += other.total[m]
     
-    #handel arguments
-    if args.input:
-        fin = args.input
-    else:
-        fin = raw_input('Input 15 minute climate data file name (\'*.csv\'): ')
+    def blocks(self):
+        '''Percent of the month's readings, mean, std dev and skew of the speeds for each direction, as
+        {direction: [(pct, mean, std, skew) for each month]}, with None for a month where they can't
+        be computed (eg. no readings from that direction)'''
+        blocks = dict((key, []) for key in DIRECTIONS)
+        if isinstance(self.cells[0][0], OnlineStats):
+            for m in range(12):
+                for s, key in enumerate(DIRECTIONS):
+                    values = self.cells[m][s]
+                    stats = _stat(_skewed, values)
+                    if stats is None:
+                        blocks[key].append(None)
+                    else:
+                        mean, std, skew = stats
+                        blocks[key].append((float(len(values))/self.total[m]*100, mean, std, skew))
+            return blocks
         
-    if '.csv' not in fin:
-        print "Using test input file"
-        fin = "test.csv"
+        #all the cells at once, cell m*len(DIRECTIONS) + s
+        cells = [np.asarray(cell, dtype=float) for row in self.cells for cell in row]
+        count, mean, std, median, skew = _grouped_stats(np.concatenate(cells), [len(cell) for cell in cells])
+        for m in range(12):
+            for s, key in enumerate(DIRECTIONS):
+                i = m*len(DIRECTIONS) + s
+                if np.isfinite(skew[i]):
+                    blocks[key].append((float(count[i])/self.total[m]*100, mean[i], std[i], float(skew[i])))
+                else:
+                    blocks[key].append(None)
+        return blocks
+
+
+INTERVAL = 15 #minutes between the records the '.par' parameters were worked out for
+
+def resampled(interval):
+    '''Minutes between the records the engines work on, for input records `interval` minutes apart:
+    records closer together are added up to INTERVAL minutes as they're read (see Resampler) when
+    INTERVAL is a multiple of their interval, others are worked on as they are with the precip
+    windows and storm gap sized to them (see window_steps)'''
+    if not 1 <= interval <= 60:
+        raise ValueError('the records need to be 1 to 60 minutes apart, not %s' % interval)
+    return INTERVAL if interval < INTERVAL and INTERVAL % interval == 0 else interval
+
+def window_steps(interval=INTERVAL):
+    '''Time steps of records `interval` minutes apart in the 30 minute and 6 hour precip windows and
+    in the dry gap that ends a storm (an hour), at least one of each: (2, 24, 4) at 15 minutes'''
+    return tuple(max(1, int(round(float(minutes)/interval))) for minutes in (30, 360, 60))
+
+
+class RollingWindow(object):
+    '''Moving window over the last `size` time steps of precip with a running sum.
     
-    if args.output:
-        fout = args.fout
-    else:
-        fout = raw_input('Output parameter file name (\'*.par\'): ')
-    if '.par' not in fout:
-        print "Using test output file"    
-        fout = "test.par"
-        
+    The values are kept in a ring buffer so a push is constant time. The running sum is set back
+    to exactly 0 whenever the window is dry, so rounding error can't build up between storms.'''
+    
+    def __init__(self, size):
+        self.size = size
+        self.values = [0.0]*size
+        self.pos = 0 #slot of the oldest value
+        self.wet = 0 #number of non-zero values in the window
+        self.total = 0.0
+    
+    def push(self, value):
+        old = self.values[self.pos]
+        self.values[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        if old != 0:
+            self.wet -= 1
+        if value != 0:
+            self.wet += 1
+        if self.wet:
+            self.total += value - old
+        else:
+            self.total = 0.0
+        return self.total
 
-    with open(fin, 'rb') as filereader:
-        with open(fout, 'w') as o:
-            data_arr = csv.DictReader(filereader)
-            
-            
-            
-            prcp_hist_list = [0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0] #moving window of precip, 2 hours
-            prcp_hist6_list = [0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,
-                              0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0,
-                              0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0] #moving window of precip, 6 hours
-            prcp30_list = [0,0]
-            t=0
-            pmax = 0
-            tf = 0
-            tmax = 0
-            prcp30_max = 0
-            prcp30_record = 0
-            prcp6_record = 0
-            daynum = 0
-            daycount = 0
-            srad_list = []
-            templistall = []
-            calm_list = []
-            day0 = []
-            day1 = []
-            dtempmax = None
-            dtempmin = None
-            months_dic = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}
-            dd = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}
-            ww = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}
-            wd = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}
-            ttp_dic = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}
-            dew_dic = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}
-            srad_dic = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}
-            tempmax_dic = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}
-            tempmin_dic = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}
-            prcp30_max_dic = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}
-            calm_dic = {'1':[0,0],'2':[0,0],'3':[0,0],'4':[0,0],'5':[0,0],'6':[0,0],'7':[0,0],'8':[0,0],'9':[0,0],'10':[0,0],'11':[0,0],'12':[0,0]}
-            
+
+STORM_GAP = 4 #dry time steps that end a storm in the '.par', an hour of 15 minute records
+
+class StormDetector(object):
+    '''Splits the precip record into storms, one time step at a time.
+    
+    A storm is over on the first time step after `gap` dry steps in a row that still has precip
+    within the last `window` steps (by default 2*gap: 4 steps and 2 hours of 15 minute data). Time
+    steps without a record count as dry but don't add to the storm time. The records are `interval`
+    minutes apart, which sizes the 30 minute window of the storm's largest 30 minute precip.'''
+    
+    def __init__(self, gap=STORM_GAP, window=None, interval=INTERVAL):
+        self.gap = gap
+        self.window = window or 2*gap
+        self.t = 0 #time steps since the last storm ended
+        self.tmax = 0 #time step of the storm's peak
+        self.pmax = 0 #storm peak
+        self.dry = 0 #dry steps in a row
+        self.age = None #steps since the last wet one of this storm
+        self.step = 0 #time steps so far, with or without a record
+        self.depth = 0.0 #precip of the storm so far
+        self.first = None #(time step, datetime) of the storm's first wet step
+        self.last = None #(time step, datetime) of its last wet step
+        self.peak = 0 #time step of the peak
+        self.recent = [0.0]*window_steps(interval)[0] #precip of the last 30 minutes, oldest first
+        self.p30 = 0.0 #largest 30 minute precip of the storm
+    
+    def _push(self, p, when=None):
+        self.step += 1
+        recent = self.recent
+        del recent[0]
+        recent.append(p)
+        if p != 0:
+            self.dry = 0
+            self.age = 0
+            self.depth += p
+            self.last = (self.step, when)
+            if self.first is None:
+                self.first = self.last
+            p30 = sum(recent)
+            if p30 > self.p30:
+                self.p30 = p30
+        else:
+            self.dry += 1
+            if self.age is not None:
+                self.age += 1
+    
+    def skip(self):
+        '''Time step without a record'''
+        self._push(0.0)
+    
+    def add(self, p, when=None):
+        '''Adds the precip for the next time step (with its datetime, for the storm table). Returns
+        the storm if one ended on this step, otherwise None: (time step of the peak, length of the
+        storm) counted from the end of the storm before, as the time to peak uses them, then the
+        peak, depth, first and last wet (time step, datetime), the time step of the peak and the
+        largest 30 minute precip (see StormTable.add)'''
+        self._push(p, when)
+        if p > self.pmax:
+            self.pmax = p
+            self.tmax = self.t
+            self.peak = self.step
+        storm = None
+        if self.dry >= self.gap and self.age is not None and self.age < self.window:
+            storm = (self.tmax, self.t-self.gap, self.pmax, self.depth, self.first, self.last, self.peak, self.p30)
+            self.t = 0
+            self.tmax = 0
+            self.pmax = 0
+            self.age = None
+            self.depth = 0.0
+            self.first = None
+            self.p30 = 0.0
+        self.t += 1
+        return storm
+
+
+#columns of a storm table, see StormTable
+STORM_FIELDS = ('start', 'end', 'month', 'duration', 'depth', 'peak_intensity', 'peak30_intensity', 'peak_offset', 'ttp')
+
+class StormTable(object):
+    '''The storms found with one dry gap, in the order they ended, and the time to peak of each by 
+    month (ttp, for the '.par'). A row for each storm (see STORM_FIELDS):
+    start, end      datetimes of its first and last wet time steps, as (year, month, day, hour, minute)
+    month           month the storm is filed under, the month of the record it ended on (1-12)
+    duration        time steps from the first wet one to the last
+    depth           precip (in)
+    peak_intensity  largest precip of a time step (in/hr)
+    peak30_intensity largest 30 minute precip (in/hr)
+    peak_offset     time steps from the first wet one to the (first) peak
+    ttp             time to peak as the '.par' has it: the time steps to the peak over the time steps
+                    of the storm, both counted from the end of the storm before (None for a storm of
+                    a single time step)
+    
+    The time steps are `interval` minutes long; with a step of more than 15 minutes the 30 minute
+    window is the shortest number of whole steps around 30 minutes (see window_steps) and the
+    intensity is over its length. The rows aren't kept with keep=False (rows is None), only the time
+    to peak.
+    
+    Only the time to peak of the '.par' comes from the table. MX .5 P is the mean by month of each
+    wet day's largest 30 minute intensity (as CLIGEN defines it), which the storms can't give: a
+    storm can run over several days and a day can have several storms, and a 30 minute window can
+    span two storms. So MX .5 P stays on the daily maxima of the pass, as the original loop worked it
+    out, and peak30_intensity is the storm's own.'''
+    
+    def __init__(self, gap=STORM_GAP, sample=list, keep=True, interval=INTERVAL):
+        self.gap = gap
+        self.rows = [] if keep else None
+        self.count = 0
+        self.ttp = _month_dict(sample)
+        #hours in a time step and in the 30 minute window, for the intensities
+        self.hours = (interval/60.0, window_steps(interval)[0]*interval/60.0)
+    
+    def add(self, month, storm, rejected=None):
+        '''Adds a storm from StormDetector.add that ended on a record of month ('1'-'12'), counting 
+        a storm of one time step in rejected (if given)'''
+        tmax, steps, pmax, depth, first, last, peak, p30 = storm
+        try:
+            ttp = float(tmax)/steps
+            self.ttp[month].append(ttp)
+        except ZeroDivisionError:
+            #Storm event lasted a time step of 0; only one 15 min precip event recorded
+            ttp = None
+            if rejected is not None:
+                rejected['one step storm'] += 1
+        self.count += 1
+        if self.rows is not None:
+            self.rows.append((_timestamp(first[1]), _timestamp(last[1]), int(month), last[0] - first[0] + 1,
+                              depth, pmax/self.hours[0], p30/self.hours[1], peak - first[0], ttp))
+    
+    def write(self, o):
+        '''Writes the rows to the open '.csv' file o'''
+        if self.rows is None:
+            raise ValueError('the rows of this storm table weren\'t kept')
+        writer = csv.writer(o)
+        writer.writerow(STORM_FIELDS)
+        for start, end, month, duration, depth, peak, peak30, offset, ttp in self.rows:
+            writer.writerow((_datetime_text(start), _datetime_text(end), month, duration, '%.4f' % depth,
+                             '%.4f' % peak, '%.4f' % peak30, offset, '' if ttp is None else '%.4f' % ttp))
+
+def _datetime_text(timestamp):
+    #"mm/dd/yyyy hh:mm" from a (year, month, day, hour, minute)
+    return '' if timestamp is None else '{1}/{2}/{0} {3}:{4:02d}'.format(*timestamp)
+
+
+RESAMPLED = ('temp', 'humid', 'srad', 'ws') #columns averaged over each INTERVAL minutes
+
+def _date_of(date):
+    #(year, month, day) of "mm/dd/yyyy", None if it can't be parsed
+    try:
+        (m,d,y) = date.split("/")
+        return (int(y), int(m), int(d))
+    except ValueError:
+        return None
+
+def _part_of(hhmm):
+    #INTERVAL minutes of the day of "hh:mm", the first if it can't be parsed
+    try:
+        (hh,mm) = hhmm.split(":")
+        return (int(hh)*60 + int(mm))//INTERVAL
+    except ValueError:
+        return 0
+
+def _numbers(values):
+    #the values that are numbers, as floats
+    out = []
+    for v in values:
+        if v != '' and v is not None:
+            try:
+                v = float(v)
+            except ValueError:
+                continue
+            if v == v:
+                out.append(v)
+    return out
+
+class Resampler(object):
+    '''Adds up climate records `interval` minutes apart (INTERVAL being a multiple of it) into
+    INTERVAL minute records as they're read, so a 1, 3 or 5 minute record goes through the per-row
+    pass without being written out again at 15 minutes first.
+    
+    The records in each INTERVAL minutes of a day (eg. 3:00, 3:05 and 3:10) make one record with the
+    datetime of its start. Its prcp is their total, temp, humid, srad and ws their mean, and wdir the
+    direction of the mean of their unit vectors, each leaving out the values that aren't numbers (and
+    directions out of range), and blank where none are. A record without a date is passed on as it
+    is. The records are taken to be in time order; ones of the same INTERVAL minutes that aren't next
+    to each other make a record each.'''
+    
+    def __init__(self, interval):
+        self.interval = interval
+        self.last = None #datetime of the last record read
+        self.key = None #INTERVAL minutes of the records held back by rows
+        self.group = []
+    
+    def rows(self, data_arr, hold=False):
+        '''Yields the resampled records of data_arr (csv.DictReader rows, or dicts like them), with
+        floats for the values that aren't blank. With hold, the records of the last INTERVAL minutes
+        are held back instead, and joined by the ones of the same INTERVAL minutes in the next call.'''
+        group, key = self.group, self.key
+        #the datetimes are read like _parse_dates, the date of the day and each time parsed once
+        day, date, parts = None, None, {}
+        for row in data_arr:
+            datetime = row['datetime']
+            self.last = datetime or self.last
+            fields = datetime.split(" ") if datetime else ['']
+            if fields[0] != day:
+                day, date = fields[0], _date_of(fields[0])
+            if date is None:
+                k = None
+            elif len(fields) > 1:
+                part = parts.get(fields[-1])
+                if part is None:
+                    part = parts[fields[-1]] = _part_of(fields[-1])
+                k = date + (part,)
+            else:
+                k = date + (0,)
+            if k != key or k is None:
+                if group:
+                    yield _resampled_row(key, group)
+                group = []
+                key = k
+                if k is None:
+                    yield row
+                    continue
+            group.append(row)
+        if group and not hold:
+            yield _resampled_row(key, group)
+            group, key = [], None
+        self.group, self.key = group, key
+
+def _resampled_row(key, group):
+    #one record from the records of the same INTERVAL minutes
+    y, m, d, i = key
+    row = {'datetime':'%d/%d/%d %d:%02d' % (m, d, y, i*INTERVAL//60, i*INTERVAL % 60)}
+    prcp = _numbers([r['prcp'] for r in group])
+    row['prcp'] = sum(prcp) if prcp else ''
+    for c in RESAMPLED:
+        values = _numbers([r[c] for r in group])
+        row[c] = sum(values)/len(values) if values else ''
+    dirs = [radians(v) for v in _numbers([r['wdir'] for r in group]) if 0.0 <= v <= 360.0]
+    row['wdir'] = degrees(atan2(sum(sin(v) for v in dirs), sum(cos(v) for v in dirs))) % 360.0 if dirs else ''
+    return row
+
+
+class QuantileSketch(object):
+    '''Bounded size stand-in for the sorted values of a sample, used for medians in streaming mode.
+    
+    Values are counted in logarithmic buckets, so a value read back at any rank is within a 
+    relative error of alpha (0.5%) of the sample's value at that rank; values closer to 0 than tiny 
+    are counted as 0. The number of buckets depends only on the range of the values (at most about 
+    2000 for each sign between 1e-6 and 1000), not on how many values there are.'''
+    
+    def __init__(self, alpha=0.005, tiny=1e-6):
+        self.gamma = (1 + alpha)/(1 - alpha)
+        self.tiny = tiny
+        self.offset = int(floor(log(tiny)/log(self.gamma)))
+        self.buckets = {} #bucket -> count; 0 holds values near 0, negative values have negative buckets
+        self.n = 0
+    
+    def add(self, x, count=1):
+        if abs(x) < self.tiny:
+            key = 0
+        else:
+            key = int(ceil(log(abs(x))/log(self.gamma))) - self.offset
+            if x < 0:
+                key = -key
+        self.buckets[key] = self.buckets.get(key, 0) + count
+        self.n += count
+    
+    def merge(self, other):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.n += other.n
+    
+    def value(self, key):
+        if key == 0:
+            return 0.0
+        v = 2*self.gamma**(abs(key) + self.offset)/(self.gamma + 1)
+        return v if key > 0 else -v
+    
+    def median(self):
+        '''Median, averaging the middle two values of an even count like np.median'''
+        if not self.n:
+            raise ValueError('median of an empty sample')
+        ranks = [(self.n - 1)//2, self.n//2]
+        values = []
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            while ranks and ranks[0] < seen:
+                values.append(self.value(key))
+                ranks.pop(0)
+        return (values[0] + values[1])/2
+
+
+class OnlineStats(object):
+    '''Constant memory summary of a sample, used in place of a list of values in streaming mode:
+    count, running mean and variance (Welford), and a QuantileSketch for the median.'''
+    
+    def __init__(self):
+        self.n = 0
+        self.mu = 0.0
+        self.m2 = 0.0
+        self.sketch = QuantileSketch()
+    
+    def append(self, x):
+        x = float(x)
+        self.n += 1
+        delta = x - self.mu
+        self.mu += delta/self.n
+        self.m2 += delta*(x - self.mu)
+        self.sketch.add(x)
+    
+    def __len__(self):
+        return self.n
+    
+    def merged(self, other):
+        '''Summary of both samples together'''
+        both = OnlineStats()
+        both.n = self.n + other.n
+        if both.n:
+            delta = other.mu - self.mu
+            both.mu = self.mu + delta*other.n/both.n
+            both.m2 = self.m2 + other.m2 + delta**2*self.n*other.n/both.n
+        both.sketch.merge(self.sketch)
+        both.sketch.merge(other.sketch)
+        return both
+    
+    def mean(self):
+        if not self.n:
+            raise ValueError('mean of an empty sample')
+        return self.mu
+    
+    def std(self):
+        if not self.n:
+            raise ValueError('std of an empty sample')
+        return sqrt(self.m2/self.n)
+    
+    def median(self):
+        return self.sketch.median()
+
+
+def _mean_of(values):
+    return values.mean() if isinstance(values, OnlineStats) else np.mean(values)
+
+def _std_of(values):
+    return values.std() if isinstance(values, OnlineStats) else np.std(values)
+
+def _median_of(values):
+    return values.median() if isinstance(values, OnlineStats) else np.median(values)
+
+def _concat(a, b):
+    if isinstance(a, OnlineStats):
+        return a.merged(b)
+    return [float(i) for i in a] + [float(i) for i in b]
+
+def _month_dict(factory):
+    return dict((str(m), factory()) for m in range(1, 13))
+
+def _grouped_stats(values, lengths, medians=True):
+    '''Count, mean, std dev, median and skew (3*(mean-median)/std) of each group of the values,
+    which come grouped in runs of the given lengths (eg. by month, or month and direction), as
+    arrays, nan where a group has no values (and a skew where it has no spread). All the groups are
+    worked out from the one array: the mean and std dev of a group are reduced over a view of its
+    run like np.mean and np.std, so they come out the same to the last bit, and its median is
+    selected from it (a partition, not a sort) unless medians is False.'''
+    count = np.asarray(lengths, dtype=int)
+    starts = np.concatenate(([0], np.cumsum(count)[:-1])).astype(int)
+    mean, std, median = np.empty(len(count)), np.empty(len(count)), np.empty(len(count))
+    mean.fill(np.nan)
+    std.fill(np.nan)
+    median.fill(np.nan)
+    with np.errstate(all='ignore'):
+        for g in np.flatnonzero(count):
+            part = values[starts[g]:starts[g] + count[g]]
+            mean[g] = np.add.reduce(part)/count[g]
+            dev = part - mean[g]
+            dev *= dev
+            std[g] = np.add.reduce(dev)/count[g]
+            if not medians:
+                continue
+            lo, hi = (count[g] - 1)//2, count[g]//2
+            middle = np.partition(part, (lo, hi))
+            median[g] = (middle[lo] + middle[hi])/2
+        std = np.sqrt(std)
+        skew = 3*(mean - median)/std
+    return count, mean, std, median, skew
+
+def _month_stats(samples, medians=True):
+    #_grouped_stats by month of samples ({'1': values, ...}), a month's values taken from each in turn
+    parts = [np.asarray(sample[str(m)], dtype=float) for m in range(1, 13) for sample in samples]
+    lengths = np.array([len(part) for part in parts]).reshape(12, len(samples)).sum(axis=1)
+    return _grouped_stats(np.concatenate(parts), lengths, medians)
+
+def _listed(values):
+    return [float(v) if np.isfinite(v) else None for v in values]
+
+def _monthly(sample):
+    #mean and std dev of a sample by month as lists, None where they can't be computed
+    if isinstance(sample['1'], OnlineStats):
+        months = [str(m) for m in range(1, 13)]
+        return [_stat(_mean_of, sample[m]) for m in months], [_stat(_std_of, sample[m]) for m in months]
+    count, mean, std, median, skew = _month_stats([sample], False)
+    return _listed(mean), _listed(std)
+
+
+DEW_BLOCK = 10000 #rows the per-row pass computes dew points for at once
+
+def dew_points(temp, humid):
+    '''Dew point (simple approx) for arrays of temp and humidity, as a masked array. Where it can't
+    be computed (humidity of 0 or less, or missing) it's masked, not an error.'''
+    temp = np.asarray(temp, dtype=float)
+    humid = np.asarray(humid, dtype=float)
+    with np.errstate(all='ignore'):
+        lh = np.ma.log(np.ma.masked_where(~(humid > 0), humid)/100)
+        dew = 243.04*(lh+((17.625*temp)/(243.04+temp)))/(17.625-lh-((17.625*temp)/(243.04+temp)))
+    return np.ma.masked_invalid(dew)
+
+def _add_dew_points(dew_dic, months, temps, humids, rejected=None):
+    #adds the dew points of the waiting rows to their months in order, and empties the lists
+    if not months:
+        return
+    dew = dew_points(temps, humids)
+    ok = ~np.ma.getmaskarray(dew)
+    if rejected is not None:
+        rejected['dew point out of range'] += len(months) - int(ok.sum())
+    for m, value in compress(zip(months, dew.data.tolist()), ok.tolist()):
+        dew_dic[m].append(value)
+    del months[:], temps[:], humids[:]
+
+#what the per-row pass counts (RowPass.feed) when it has to leave out or work around a record or value
+REJECTED = (('no datetime or precip', 'record without a datetime or precip, only counted as a dry time step'),
+            ('temp missing', 'blank temp'), ('temp unparseable', 'temp that isn\'t a number'),
+            ('humid missing', 'blank humidity, no dew point'), ('humid unparseable', 'humidity that isn\'t a number, no dew point'),
+            ('srad missing', 'blank solar radiation'), ('srad unparseable', 'solar radiation that isn\'t a number'),
+            ('ws missing', 'blank wind speed, not counted as calm or windy'), ('ws unparseable', 'wind speed that isn\'t a number'),
+            ('wdir missing', 'blank wind direction, the last one read is used'), ('wdir unparseable', 'wind direction that isn\'t a number'),
+            ('wdir out of range', 'wind direction outside 0-360 degrees (NA)'),
+            ('dew point out of range', 'dew point that can\'t be computed, eg. from 0 humidity'),
+            ('wind reading kept', 'record missing temp, humidity, solar radiation or wind speed, the last wind reading is used'),
+            ('day without temp', 'day left out of the max and min temperatures'),
+            ('one step storm', 'storm of a single time step, left out of the time to peak'))
+
+def _bad_field(row, c):
+    #category of a value that isn't a number
+    return c + (' missing' if row[c] in ('', None) else ' unparseable')
+
+
+class RowPass(object):
+    '''The per-row pass over the climate records as an object, so the records can be fed to it in
+    pieces (feed) and its state saved between runs (see update_par). Feeding the records in any number
+    of pieces gives the same daily and monthly values (result) as one pass over all of them.
+    
+    The values for each month are collected in a list, or in whatever sample() returns (it needs 
+    an append method and a length); OnlineStats gives the constant memory streaming mode.
+    
+    The storms are split with each of the dry gaps in gaps (by default an hour, see window_steps) in
+    the same pass, into a StormTable for each (tables). The first gap gives the time to peak of the
+    result; the streaming mode only keeps the time to peak of its storms, not their rows.
+    
+    The records are `interval` minutes apart. Finer records are added up to INTERVAL minutes as they
+    are fed (see Resampler), and the precip windows and storm gap are sized to the records the pass
+    works on (step); last is still the datetime of the last record fed.'''
+    
+    def __init__(self, sample=list, gaps=None, interval=INTERVAL):
+        self.sample = sample
+        self.interval = interval
+        self.step = resampled(interval)
+        self.resampler = Resampler(interval) if self.step != interval else None
+        steps30, steps6, gap = window_steps(self.step)
+        self.gaps = tuple(gaps or (gap,))
+        self.detectors = [StormDetector(g, interval=self.step) for g in self.gaps] #storm separation, over a 2 hour window of precip by default
+        self.tables = [StormTable(g, sample, sample is list, self.step) for g in self.gaps]
+        self.prcp_hist6 = RollingWindow(steps6) #moving window of precip, 6 hours
+        self.prcp30 = RollingWindow(steps30)
+        self.hours30 = steps30*self.step/60.0 #hours in the 30 minute window, for the intensity
+        self.prcp30_max = 0
+        self.prcp30_record = 0
+        self.prcp6_record = 0
+        self.daynum = 0
+        self.daycount = 0
+        self.srad_list = []
+        self.day0 = []
+        self.day1 = []
+        self.dtempmax = None
+        self.dtempmin = None
+        self.wind = WindRose(sample)
+        self.dd = _month_dict(sample)
+        self.ww = _month_dict(sample)
+        self.wd = _month_dict(sample)
+        self.dew_dic = _month_dict(sample)
+        self.srad_dic = _month_dict(sample)
+        self.tempmax_dic = _month_dict(sample)
+        self.tempmin_dic = _month_dict(sample)
+        self.prcp30_max_dic = _month_dict(sample)
+        self.calm_dic = {'1':[0,0],'2':[0,0],'3':[0,0],'4':[0,0],'5':[0,0],'6':[0,0],'7':[0,0],'8':[0,0],'9':[0,0],'10':[0,0],'11':[0,0],'12':[0,0]}
+        self.rowcount = 0
+        self.last = None #datetime of the last record fed
+        self.dir = None #last wind direction read
+        self.wind_tup = None #last wind speed and direction read
+    
+    def feed(self, data_arr, rejected=None, hold=False):
+        '''Runs the pass over more records (eg. a csv.DictReader), carrying on from the last ones.
+        With a Counter for rejected, the records and values the pass leaves out or works around are
+        counted in it by category (see REJECTED). With hold, when the records are added up to 
+        INTERVAL minutes the ones of the last INTERVAL minutes wait for the next feed (see Resampler).'''
+        #the loop works on locals, which are saved back once it's done
+        prcp_hist6, prcp30, wind = self.prcp_hist6, self.prcp30, self.wind
+        dd, ww, wd, detectors = self.dd, self.ww, self.wd, self.detectors
+        #one step storms are counted for the first gap, the one the result's time to peak comes from
+        sweep = zip(detectors, self.tables, [rejected] + [None]*(len(detectors) - 1))
+        dew_dic, srad_dic, tempmax_dic, tempmin_dic = self.dew_dic, self.srad_dic, self.tempmax_dic, self.tempmin_dic
+        prcp30_max_dic, calm_dic = self.prcp30_max_dic, self.calm_dic
+        prcp30_max, prcp30_record, prcp6_record, daynum = self.prcp30_max, self.prcp30_record, self.prcp6_record, self.daynum
+        daycount, srad_list, day0, day1 = self.daycount, self.srad_list, self.day0, self.day1
+        dtempmax, dtempmin, rowcount, last = self.dtempmax, self.dtempmin, self.rowcount, self.last
+        dir, wind_tup = self.dir, self.wind_tup
+        dew_m, dew_t, dew_h = [], [], [] #month, temp and humidity of the rows waiting for a dew point
+        hours30 = self.hours30
+        if self.resampler is not None:
+            data_arr = self.resampler.rows(data_arr, hold)
+        
+        #treat numpy errors as real errors
+        with np.errstate(all='raise'):
             for row in data_arr:
+                rowcount += 1
+                last = row['datetime'] or last
                 if row['datetime'] == '' or row['prcp'] == '':
-                    prcp_hist_list.insert(0,0.0)
-                    prcp_hist_list.pop()
-                    prcp30_list.insert(0,0.0)
-                    prcp30_list.pop()
-                    prcp_hist6_list.insert(0,0.0)
-                    prcp_hist6_list.pop()
+                    if rejected is not None:
+                        rejected['no datetime or precip'] += 1
+                    for storms in detectors:
+                        storms.skip()
+                    prcp30.push(0.0)
+                    prcp_hist6.push(0.0)
                     continue
                 else:
                     #c    %    w/m2    m/s    mm    degrees
@@ -179,48 +850,50 @@ if __name__ == "__main__":
                     try:
                         row['temp'] = float(row['temp'])*1.8+32 #C to F
                     except:
-                        pass
+                        if rejected is not None:
+                            rejected[_bad_field(row, 'temp')] += 1
                         #row['humid'] = float(row['humid']) #percent
                     try:
                         row['srad'] = float(row['srad'])/0.484583 #w/m2 to lang
                         #row['ws'] = float(row['ws']) ##m/s to 
                         #row['wdir'] = float(row['wdir']) #deg
                     except:
-                        pass
-                    
-                    
+                        if rejected is not None:
+                            rejected[_bad_field(row, 'srad')] += 1
+            
+            
                     date = dateparse(row['datetime'])
                     p = float(row['prcp'])
-                    
-                    
-                    prcp_hist_list.insert(0,p)
-                    prcp_hist_list.pop()
-                    prcp_hist6_list.insert(0,p)
-                    prcp_hist6_list.pop()
-                    prcp30_list.insert(0,p)
-                    prcp30_list.pop()
+            
+            
+                    prcp_hist6.push(p)
+                    prcp30.push(p)
                     try:
                         if float(row['ws'])<=0.3:
                             calm_dic[date['m']][0] +=1
                         else:
                             calm_dic[date['m']][1] +=1
                     except:
-                        pass    
+                        if rejected is not None:
+                            rejected[_bad_field(row, 'ws')] += 1
                     if daynum == 0:
                         #its the beginning of the file
                         daynum = int(date['d'])
                         day1.append(p)
                         dtempmax = row['temp']
                         dtempmin = row['temp']
-                        srad_list.append(float(row['srad']))
+                        try:
+                            srad_list.append(float(row['srad']))
+                        except:
+                            pass
                     elif int(date['d']) == daynum:
                         # its the same day
                         if dtempmax < row['temp']:
                             dtempmax = row['temp']
                         if dtempmin > row['temp']:
                             dtempmin = row['temp']
-                        if sum(prcp30_list)> prcp30_max:
-                            prcp30_max = sum(prcp30_list)
+                        if prcp30.total > prcp30_max:
+                            prcp30_max = prcp30.total
                         day1.append(p)
                         try:
                             srad_list.append(float(row['srad']))
@@ -234,12 +907,13 @@ if __name__ == "__main__":
                             tempmin_dic[date['m']].append(round(float(dtempmin)))
                             tempmax_dic[date['m']].append(round(float(dtempmax)))
                         except:
-                            pass
+                            if rejected is not None:
+                                rejected['day without temp'] += 1
                         if prcp30_max>0:
-                            prcp30_max_dic[date['m']].append(prcp30_max/.5)
+                            prcp30_max_dic[date['m']].append(prcp30_max/hours30)
                         prcp30_max = 0
-                        if sum(prcp30_list)> prcp30_max:
-                            prcp30_max = sum(prcp30_list)
+                        if prcp30.total > prcp30_max:
+                            prcp30_max = prcp30.total
                         if sum(day1)>0 and sum(day0)>0:
                             #wet wet
                             ww[date['m']].append(sum(day1))
@@ -249,295 +923,1926 @@ if __name__ == "__main__":
                         else:
                             #dry dry or dry wet
                             dd[date['m']].append(sum(day1))     
-                        srad_dic[date['m']].append(np.mean(srad_list))    
+                        if srad_list:
+                            #a day without srad read (eg. one of a single row) is left out, as in the columnar engine
+                            srad_dic[date['m']].append(np.mean(srad_list))
                         dtempmax = row['temp']
                         dtempmin = row['temp']
                         day0 = day1
                         day1 = []
                         srad_list = []
-                    
-                    
-                    if max(prcp_hist_list) > pmax:
-                        pmax = max(prcp_hist_list)
-                        tmax = t
-                        
-                    if p > max(prcp_hist_list) and prcp_hist_list[0] <= 0:
-                        #storm started, reset counters and max prcp
-                        t=0
-                        tf = 0
-                        pmax = 0
-                    if sum(prcp_hist6_list)> prcp6_record:
-                          prcp6_record = sum(prcp_hist6_list)
-                    if sum(prcp_hist_list[0:4]) == 0 and sum(prcp_hist_list) != 0:
-                        #storm over, change the length of searched array to change how long between stormsmeans its over
-                        
-                        try:
-                            tf = t-4
-                            ttp_dic[date['m']].append(float(tmax)/tf)
-                            
-                        except: 
-                            #Storm event lasted a time step of 0; only one 15 min precip event recorded
-                            pass
-                        t=0
-                        tf = 0
-                        tmax = 0
-                        pmax = 0
-                        prcp_hist_list = [0.0,0.0,0.0,0.0,0.0,0.0,0.0,0.0]
-                    
+            
+            
+                    for storms, table, counts in sweep:
+                        storm = storms.add(p, row['datetime'])
+                        if storm:
+                            #storm over
+                            table.add(date['m'], storm, counts)
+                    if prcp_hist6.total > prcp6_record:
+                        prcp6_record = prcp_hist6.total
+            
                     if prcp30_max > prcp30_record:
                         prcp30_record = prcp30_max
-                    
-                    #Increment time counter   
-                    
-                    t += 1    
-                    
-                    
-                    #simple approx
+            
+            
+                    #dew point, computed a block of rows at a time
                     try:
                         tmp = float(row['temp'])
                         h = float(row['humid'])
-                        dew = 243.04*(np.log(h/100)+((17.625*tmp)/(243.04+tmp)))/(17.625-np.log(h/100)-((17.625*tmp)/(243.04+tmp)))
-                        #print type(dew)
-                        try:
-                            float(dew)
-                            dew_dic[date['m']].append(float(dew))
-                        except:
-                            pass
-                        
-                    except:
-                        pass
-                    
+                        dew_m.append(date['m'])
+                        dew_t.append(tmp)
+                        dew_h.append(h)
+                        if len(dew_m) >= DEW_BLOCK:
+                            _add_dew_points(dew_dic, dew_m, dew_t, dew_h, rejected)
+                    except (TypeError, ValueError):
+                        if rejected is not None and not _parses(row['humid']):
+                            rejected[_bad_field(row, 'humid')] += 1
+            
                     tup = ()
                     try:
                         dir = windDirection(float(row['wdir']))
+                        if dir == 'NA' and rejected is not None:
+                            rejected['wdir out of range'] += 1
                     except:
-                        pass
+                        if rejected is not None:
+                            rejected[_bad_field(row, 'wdir')] += 1
                     try:
                         tup = (float(row['temp']),float(row['prcp']),float(row['humid']),float(row['srad']))
                         wind_tup = (float(row['ws']),dir)
                     except:
-                        pass
-                    months_dic[date['m']].append([tup,wind_tup])
-                    
-                    
-            #finished reading file    
-            
-            
-            #station info
-            '''
-             MOSCOW U OF I ID                        106152 0
-             LATT=  46.73 LONG=-117.00 YEARS= 45. TYPE= 3
-             ELEVATION = 2630. TP5 =  .85 TP6= 1.70
-            
-            '''
-            station_name = fin.split('.')[0].upper()
-            station_id = "000000 0"
-            coords = (46.73,-117.00)
-            itype = 3 # 1-4
-            years = floor(daycount/360) #used 360 days to capture a small gaps in a year
-            if years < 10:
-                print "Number of years ({:.0f}) is less than 10.. Consider using a larger dataset.\nSmall datasets will not adequately capture long-term trends".format(years)
-                
-            elevation = "0000" #ft
-            tp5 = round(prcp30_record,2)
-            tp6 = round(prcp6_record,2)
-            o.write('{0: <41}{1}\n'.format(station_name, station_id))
-            o.write('LATT ={c[0]: >7} LONG={c[1]: >7} YEARS={y: >3}. TYPE= {t}\n'.format(c=coords,y=int(years),t=itype))
-            o.write('ELEVATION = {e: >4} TP5 = {tp5: <5} TP6 = {tp6}\n'.format(e=elevation,tp5=tp5,tp6=tp6))
-            
-            
-            
-            
-            
-            month_p_dic = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}  
-            for m in ww.keys():
-                try:
-                    pday = []
-                    for i in ww[m]:
-                        pday.append(float(i))
-                    for i in wd[m]:   
-                        pday.append(float(i))
-                    month_p_dic[m] = pday
-                    
-                    
-                    
-                    totaldays = len(ww[m])+len(wd[m])+len(dd[m])
-                    ww[m] = float(len(ww[m]))/totaldays
-                    wd[m] = float(len(wd[m]))/totaldays
-                    
-                    
-                except:
-                    pass
-                
-                
-            #daily average prcp    
-            
-            for m in month_p_dic.keys():
-                    try:
-                        
-                        mean =  np.mean(month_p_dic[m]) 
-                        median =  np.median(month_p_dic[m]) 
-                        std = np.std(month_p_dic[m]) 
-                        count = len(month_p_dic[m])
-                        skew = 3*(np.array(mean)-np.array(median))/np.array(std)
-                        tup = ('%.2f'%(mean),'%.2f'%(std),'%.2f'%(skew))
-                        month_p_dic[m] = tup
-                    except:
-                        pass
-            
-            
-            ww_list = []
-            wd_list = []
-            p_list = [[],[],[]]
-            for m in range(1,13):
-                for t in range(0,3):
-                    p_list[t].append(month_p_dic[str(m)][t])
-                ww_list.append('%.2f'%(ww[str(m)]))
-                wd_list.append('%.2f'%(wd[str(m)]))
-            
-            
-            #here
-            
-            
-            
-            
-            '''
-            pct, mean, std, skew  = [],[],[],[]
-            for i in dir_dic[dir]:
-                pct.append(i[0])
-                mean.append(i[1])
-                std.append(i[2])
-                skew.append(i[3])
-            '''
-            
-            
-            
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(p_list[0]),'MEAN P'))
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(p_list[1]),'S DEV P'))
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(p_list[2]),'SKEW P'))
-            
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(ww_list),'P(W/W)'))
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(wd_list),'P(W/D)'))
-            
-            
-            
-            
-            
-            
-            #monthly calculations for ttp, temp min, max, srad, dew
-            
-            
-            for m in ttp_dic.keys():
-                
-                ttp_dic[m] = np.mean(ttp_dic[m])
-                dew_dic[m] = np.mean(dew_dic[m])
-                mean = np.mean(tempmax_dic[m])
-                sd = np.std(tempmax_dic[m])
-                tempmax_dic[m] = (mean,sd)
-                mean = np.mean(tempmin_dic[m])
-                sd = np.std(tempmin_dic[m])
-                tempmin_dic[m] = (mean,sd)
-                
-                mean = np.mean(srad_dic[m])
-                sd = np.std(srad_dic[m])
-                srad_dic[m] = (mean,sd)
-                prcp30_max_dic[m] = np.mean(prcp30_max_dic[m])
-                
-                   
-                    
-                    
-                
-            
-            
-            
-            months_stat_dic = {'1':[],'2':[],'3':[],'4':[],'5':[],'6':[],'7':[],'8':[],'9':[],'10':[],'11':[],'12':[]}  
-            ttp_list = []
-            prcp30_max_list = []
-            tmax_list = [[],[]]
-            tmin_list = [[],[]]
-            srad_list = [[],[]]
-            dew_list = []
-            for m in range(1,13):
-                m = str(m) 
-                wind_list = []
-                
-                
-                wind_dic = {'N':[],'NNE':[],'NE':[],'ENE':[],'E':[],'ESE':[],'SE':[],'SSE':[],'S':[],'SSW':[],'SW':[],'WSW':[],'W':[],'WNW':[],'NW':[],'NNW':[]} 
-                
-            
-                for i in months_dic[m]:
-                    wind_list.append(i[1])
-                for i in wind_list:               
-                    wind_dic[i[1]].append(i[0])
-                for key in wind_dic.keys():
-                    try:
-                        
-                        mean =  np.mean(wind_dic[key]) 
-                        median =  np.median(wind_dic[key]) 
-                        std = np.std(wind_dic[key]) 
-                        count = len(wind_dic[key])
-                        skew = 3*(np.array(mean)-np.array(median))/np.array(std)
-                        percent = float(count)/len(wind_list)*100
-                        tup = ('%.2f'%(percent),'%.2f'%(mean),'%.2f'%(std),'%.2f'%(skew))
-                        months_stat_dic[m].append([key,tup])
-                    except:
-                        pass
-                 
-                ttp_list.append('%.3f'%(ttp_dic[m]))
-                dew_list.append('%.2f'%(dew_dic[m]))
-                prcp30_max_list.append('%.2f'%(prcp30_max_dic[m]))
-                for i in (0,1):
-                    tmin_list[i].append('%.2f'%(tempmin_dic[m][i]))
-                    tmax_list[i].append('%.2f'%(tempmax_dic[m][i]))
-                    srad_list[i].append('%.0f'%(srad_dic[m][i]))   
-            dir_dic = {'N':[],'NNE':[],'NE':[],'ENE':[],'E':[],'ESE':[],'SE':[],'SSE':[],'S':[],'SSW':[],'SW':[],'WSW':[],'W':[],'WNW':[],'NW':[],'NNW':[]}
-            for m in range(1,13):
-                #print "month: %s   calm pct: %s    not calm pct: %s"%(m,calm_dic[str(m)][0],calm_dic[str(m)][1])
-                calmpct = round((float(calm_dic[str(m)][0])/(calm_dic[str(m)][0]+calm_dic[str(m)][1]))*100,2)
-                
-                calm_list.append(calmpct)
-                for c in months_stat_dic[str(m)]:
-                    
-                    dir_dic[c[0]].append(c[1])
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(tmax_list[0]),'TMAX AV'))
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(tmin_list[0]),'TMIN AV'))
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(tmax_list[1]),'SD TMAX'))
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(tmin_list[1]),'SD TMIN'))
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(srad_list[0]),'SOL.RAD'))
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(srad_list[1]),'SD SOL'))
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(prcp30_max_list),'MX .5 P'))
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(dew_list),'DEW PT'))
-            
-            
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(ttp_list),'Time Pk'))
-            
-            
-                
-            
-            for dir in ('N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW'):
-                
-                pct, mean, std, skew  = [],[],[],[]
-                
-                for i in dir_dic[dir]:
-                    pct.append(i[0])
-                    mean.append(i[1])
-                    std.append(i[2])
-                    skew.append(i[3])
-                o.write('% {1: <6}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(pct),dir))   
-                o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(mean),'MEAN'))   
-                o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(std),'STD DEV'))   
-                o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(skew),'SKEW'))   
-            o.write('{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'.format(tuple(calm_list),'CALM'))         
-            
-            o.write('\nINTERPOLATED DATA (station & weighting factor)\n\n')
-            o.write('---Wind Stations---\n') 
-            o.write('---Solar Radiation and Max .5 P Stations---\n') 
-            o.write('---Dewpoint Stations---\n') 
-            o.write('---Time Peak Stations---\n')         
-            
-        o.close()  
+                        if rejected is not None:
+                            rejected['wind reading kept'] += 1
+                    #wind speeds by direction for each month, from the first reading on
+                    if wind_tup is not None:
+                        wind.append(int(date['m']), SECTORS.get(wind_tup[1], NA_SECTOR), wind_tup[0])
+        _add_dew_points(dew_dic, dew_m, dew_t, dew_h, rejected)
+        if self.resampler is not None:
+            last = self.resampler.last
         
+        self.prcp30_max, self.prcp30_record, self.prcp6_record, self.daynum = prcp30_max, prcp30_record, prcp6_record, daynum
+        self.daycount, self.srad_list, self.day0, self.day1 = daycount, srad_list, day0, day1
+        self.dtempmax, self.dtempmin, self.rowcount, self.last = dtempmax, dtempmin, rowcount, last
+        self.dir, self.wind_tup = dir, wind_tup
+    
+    def restart(self):
+        '''Starts over with empty daily and monthly values and counts, keeping the state carried
+        from one record to the next (the day so far, precip windows, storm and last wind reading)'''
+        fresh = RowPass(self.sample, self.gaps, self.interval)
+        for name in ('wind', 'dd', 'ww', 'wd', 'tables', 'dew_dic', 'srad_dic', 'tempmax_dic', 'tempmin_dic',
+                     'prcp30_max_dic', 'calm_dic', 'rowcount', 'daycount', 'prcp30_record', 'prcp6_record'):
+            setattr(self, name, getattr(fresh, name))
+    
+    def result(self):
+        '''The daily and monthly values needed for the '.par' file as a dictionary (see write_par),
+        with the storm tables by gap ('storms')'''
+        return {'rows':self.rowcount, 'daycount':self.daycount, 'prcp30_record':self.prcp30_record, 'prcp6_record':self.prcp6_record,
+                'ww':self.ww, 'wd':self.wd, 'dd':self.dd, 'ttp':self.tables[0].ttp, 'dew':self.dew_dic, 'srad':self.srad_dic,
+                'tempmax':self.tempmax_dic, 'tempmin':self.tempmin_dic, 'prcp30_max':self.prcp30_max_dic,
+                'calm':self.calm_dic, 'wind':self.wind, 'storms':dict((t.gap, t) for t in self.tables)}
+
+
+def accumulate_rows(data_arr, sample=list, rejected=None, gaps=None, interval=INTERVAL):
+    '''Runs the per-row pass over the climate records (eg. a csv.DictReader) and returns the
+    daily and monthly values needed for the '.par' file as a dictionary (see write_par).
+    
+    The values for each month are collected in a list, or in whatever sample() returns (it needs 
+    an append method and a length); OnlineStats gives the constant memory streaming mode. Records
+    and values left out are counted in rejected, if given (see RowPass.feed). The storms are split
+    with each of the dry gaps, and the records are `interval` minutes apart (see RowPass).'''
+    rows = RowPass(sample, gaps, interval)
+    rows.feed(data_arr, rejected)
+    return rows.result()
+
+
+def years_of_record(daycount):
+    return floor(daycount/360) #used 360 days to capture a small gaps in a year
+
+
+PAR_ROW = '{1: <8}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'
+PAR_DIRECTION_ROW = '% {1: <6}{0[0]: >6}{0[1]: >6}{0[2]: >6}{0[3]: >6}{0[4]: >6}{0[5]: >6}{0[6]: >6}{0[7]: >6}{0[8]: >6}{0[9]: >6}{0[10]: >6}{0[11]: >6}\n'
+
+#monthly parameters in the order they're written: (Parameters attribute, '.par' label, format)
+PAR_MONTHLY = (('mean_p', 'MEAN P', '%.2f'), ('sdev_p', 'S DEV P', '%.2f'), ('skew_p', 'SKEW P', '%.2f'),
+               ('p_ww', 'P(W/W)', '%.2f'), ('p_wd', 'P(W/D)', '%.2f'),
+               ('tmax_av', 'TMAX AV', '%.2f'), ('tmin_av', 'TMIN AV', '%.2f'), ('sd_tmax', 'SD TMAX', '%.2f'), ('sd_tmin', 'SD TMIN', '%.2f'),
+               ('sol_rad', 'SOL.RAD', '%.0f'), ('sd_sol', 'SD SOL', '%.0f'), ('mx5p', 'MX .5 P', '%.2f'), ('dew_pt', 'DEW PT', '%.2f'),
+               ('time_pk', 'Time Pk', '%.3f'))
+
+
+class Parameters(object):
+    '''Climate parameters of a station as written to a '.par' file, from compute_params().
+    
+    Header: station, station_id, latitude, longitude, years, itype, elevation, tp5 and tp6, along with
+    the rows and days of record they came from. Each monthly parameter (see PAR_MONTHLY, and calm) is
+    a list of 12 values, January first, and wind holds (pct, mean, std dev, skew) for each month by
+    direction. A value that can't be computed from the record (eg. a month without storms) is None.
+    interpolated holds the (name, station_id, weighting factor) of the stations listed in each
+    interpolated section (see INTERPOLATED, StationCatalog), by section.'''
+    
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+    
+    def monthly(self):
+        '''The monthly parameters as {'.par' label: list of 12 values}'''
+        rows = dict((label, getattr(self, name)) for name, label, fmt in PAR_MONTHLY)
+        rows['CALM'] = self.calm
+        return rows
+
+
+def _stat(f, values):
+    #None where a value can't be computed, eg. the mean of an empty month
+    if not len(values):
+        return None
+    try:
+        return f(values)
+    except (ArithmeticError, ValueError, IndexError):
+        return None
+
+def _skewed(values):
+    #mean, std dev and skew (from the median)
+    mean = _mean_of(values)
+    median = _median_of(values)
+    std = _std_of(values)
+    skew = 3*(np.array(mean)-np.array(median))/np.array(std)
+    return mean, std, float(skew)
+
+def compute_params(acc, station_name='', catalog=None):
+    '''Computes the monthly parameters from the values returned by accumulate_rows(),
+    accumulate_columns() or accumulate(), returning a Parameters. Numpy errors are treated as errors
+    whatever the caller's numpy settings, so a parameter that can't be computed is None. With a
+    StationCatalog, the header and interpolated sections come from the station's row in it.'''
+    with np.errstate(all='raise'):
+        params = _compute_params(acc, station_name)
+    if catalog is not None:
+        catalog.fill(params)
+    return params
+
+def _compute_params(acc, station_name):
+    months = [str(m) for m in range(1, 13)]
+    ww, wd, dd = acc['ww'], acc['wd'], acc['dd']
+    
+    #station info
+    '''
+     MOSCOW U OF I ID                        106152 0
+     LATT=  46.73 LONG=-117.00 YEARS= 45. TYPE= 3
+     ELEVATION = 2630. TP5 =  .85 TP6= 1.70
+    
+    '''
+    params = _new_params(station_name, acc['rows'], acc['daycount'], acc['prcp30_record'], acc['prcp6_record'])
+    
+    #daily average prcp, of the wet days
+    if isinstance(ww['1'], OnlineStats):
+        p = [_stat(_skewed, _concat(ww[m], wd[m])) or (None, None, None) for m in months]
+    else:
+        count, mean, std, median, skew = _month_stats([ww, wd])
+        p = [(mean[i], std[i], float(skew[i])) if np.isfinite(skew[i]) else (None, None, None) for i in range(12)]
+    params.mean_p, params.sdev_p, params.skew_p = [list(v) for v in zip(*p)]
+    totaldays = [len(ww[m])+len(wd[m])+len(dd[m]) for m in months]
+    params.p_ww = [float(len(ww[m]))/n if n else None for m, n in zip(months, totaldays)]
+    params.p_wd = [float(len(wd[m]))/n if n else None for m, n in zip(months, totaldays)]
+    
+    #monthly calculations for ttp, temp min, max, srad, dew
+    params.time_pk = _time_peak(acc['ttp'])
+    params.dew_pt = _monthly(acc['dew'])[0]
+    params.tmax_av, params.sd_tmax = _monthly(acc['tempmax'])
+    params.tmin_av, params.sd_tmin = _monthly(acc['tempmin'])
+    params.sol_rad, params.sd_sol = _monthly(acc['srad'])
+    #from the days, not the storms (see StormTable)
+    params.mx5p = _monthly(acc['prcp30_max'])[0]
+    
+    params.wind = acc['wind'].blocks()
+    calm = [acc['calm'][m] for m in months]
+    params.calm = [round((float(c[0])/(c[0]+c[1]))*100,2) if c[0]+c[1] else None for c in calm]
+    return params
+
+def _new_params(station_name, rows, daycount, prcp30_record, prcp6_record):
+    #Parameters with the header of a record of rows and days
+    return Parameters(station=station_name, station_id="000000 0", latitude=46.73, longitude=-117.00,
+                      itype=3, # 1-4
+                      elevation="0000", #ft
+                      years=years_of_record(daycount), rows=rows, days=daycount,
+                      tp5=round(prcp30_record,2), tp6=round(prcp6_record,2), interpolated={})
+
+def _time_peak(ttp):
+    return _monthly(ttp)[0]
+
+def sweep_params(acc, station_name='', catalog=None):
+    '''Parameters for each of the dry gaps the storms in acc were split with (see accumulate), by gap.
+    Only the time to peak depends on the gap.'''
+    params = compute_params(acc, station_name, catalog)
+    sweep = {}
+    with np.errstate(all='raise'):
+        for gap, table in acc['storms'].items():
+            sweep[gap] = Parameters(**params.__dict__)
+            sweep[gap].time_pk = _time_peak(table.ttp)
+    return sweep
+
+def _par_values(values, fmt, label):
+    for m, value in enumerate(values):
+        if value is None:
+            raise ValueError("%s can't be computed for month %d from this record" % (label, m + 1))
+    return tuple(fmt % (value) for value in values) if fmt else tuple(values)
+
+def write_par(o, params):
+    '''Writes the Parameters from compute_params() to the open '.par' file o'''
+    
+    if params.years < 10:
+        print "Number of years ({:.0f}) is less than 10.. Consider using a larger dataset.\nSmall datasets will not adequately capture long-term trends".format(params.years)
+    o.write(par_text(params))
+
+def par_text(params):
+    '''The '.par' file for the Parameters from compute_params(), as a string. Raises ValueError if a
+    parameter is missing.'''
+    lines = []
+    lines.append('{0: <41}{1}\n'.format(params.station, params.station_id))
+    lines.append('LATT ={c[0]: >7} LONG={c[1]: >7} YEARS={y: >3}. TYPE= {t}\n'.format(c=(params.latitude, params.longitude),y=int(params.years),t=params.itype))
+    lines.append('ELEVATION = {e: >4} TP5 = {tp5: <5} TP6 = {tp6}\n'.format(e=params.elevation,tp5=params.tp5,tp6=params.tp6))
+    
+    for name, label, fmt in PAR_MONTHLY:
+        lines.append(PAR_ROW.format(_par_values(getattr(params, name), fmt, label), label))
+    
+    for dir in DIRECTIONS:
+        blocks = params.wind[dir]
+        missing = [m + 1 for m, block in enumerate(blocks) if block is None]
+        if missing:
+            raise ValueError("%s wind can't be computed for month %d from this record" % (dir, missing[0]))
+        pct, mean, std, skew = zip(*blocks)
+        lines.append(PAR_DIRECTION_ROW.format(_par_values(pct, '%.2f', dir), dir))
+        lines.append(PAR_ROW.format(_par_values(mean, '%.2f', dir), 'MEAN'))
+        lines.append(PAR_ROW.format(_par_values(std, '%.2f', dir), 'STD DEV'))
+        lines.append(PAR_ROW.format(_par_values(skew, '%.2f', dir), 'SKEW'))
+    lines.append(PAR_ROW.format(_par_values(params.calm, None, 'CALM'), 'CALM'))
+    
+    lines.append('\nINTERPOLATED DATA (station & weighting factor)\n\n')
+    for section, heading in INTERPOLATED:
+        lines.append(heading + '\n')
+        for name, station_id, weight in params.interpolated.get(section, ()):
+            lines.append('{0: <41}{1: <10}{2: >6.3f}\n'.format(name, station_id, weight))
+    return ''.join(lines)
+
+
+EARTH_RADIUS = 6371.0 #km
+
+class StationIndex(object):
+    '''Nearest neighbour index over station locations: a k-d tree of the points on the unit sphere,
+    so the nearest by straight line are the nearest by great circle distance. Built once in
+    O(n log n); a query only looks at the leaves (of up to `leaf` points) near the point.'''
+    
+    def __init__(self, latitude, longitude, leaf=16):
+        lat, lon = np.radians(np.asarray(latitude, dtype=float)), np.radians(np.asarray(longitude, dtype=float))
+        self.points = np.column_stack((np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)))
+        self.leaf = leaf
+        self.order = np.arange(len(self.points))
+        self.nodes = [] #(axis, split, below, above) for a split, (-1, None, start, end) of order for a leaf
+        if len(self.points):
+            self._build(0, len(self.points))
+    
+    def _build(self, start, end):
+        node = len(self.nodes)
+        if end - start <= self.leaf:
+            self.nodes.append((-1, None, start, end))
+            return node
+        idx = self.order[start:end]
+        pts = self.points[idx]
+        axis = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+        mid = (end - start)//2
+        self.order[start:end] = idx[np.argpartition(pts[:, axis], mid)]
+        self.nodes.append(None)
+        split = self.points[self.order[start + mid], axis]
+        self.nodes[node] = (axis, split, self._build(start, start + mid), self._build(start + mid, end))
+        return node
+    
+    def query(self, latitude, longitude, k=1):
+        '''The k points nearest to (latitude, longitude) as (index, great circle distance in km),
+        nearest first'''
+        lat, lon = radians(latitude), radians(longitude)
+        q = np.array((cos(lat)*cos(lon), cos(lat)*sin(lon), sin(lat)))
+        best = [] #heap of (-squared distance, index)
+        stack = [(0, 0.0)] if self.nodes else [] #(node, squared distance it's at least)
+        while stack:
+            node, bound = stack.pop()
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+            axis, split, a, b = self.nodes[node]
+            if axis < 0:
+                idx = self.order[a:b]
+                d2 = ((self.points[idx] - q)**2).sum(axis=1)
+                for d, i in zip(d2.tolist(), idx.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+                continue
+            diff = q[axis] - split
+            near, far = (a, b) if diff < 0 else (b, a)
+            #the far side is looked at after the near one, if it can still hold a nearer point
+            stack.append((far, max(bound, diff*diff)))
+            stack.append((near, bound))
+        return [(i, 2*EARTH_RADIUS*asin(min(1.0, sqrt(-d)/2))) for d, i in sorted(best, reverse=True)]
+    
+#interpolated sections of the '.par': (catalog section, heading)
+INTERPOLATED = (('wind', '---Wind Stations---'), ('srad', '---Solar Radiation and Max .5 P Stations---'),
+                ('dew', '---Dewpoint Stations---'), ('tp', '---Time Peak Stations---'))
+CATALOG_NEIGHBOURS = 3 #stations weighted in each interpolated section
+
+class StationCatalog(object):
+    '''Station metadata for the '.par' header and its interpolated sections, from a '.csv' with a
+    row for each station (see load_catalog):
+    station     name the station's input gives it (see station_name_of), matched in any case
+    name        station name for the header (default: station)
+    station_id  station number for the header
+    latitude, longitude  degrees
+    elevation   ft
+    sections    which of the interpolated sections (wind, srad, dew, tp) the station's own record
+                has the data for, space separated (default: all of them)
+    
+    Each interpolated section lists the `neighbours` stations with its data nearest to the station,
+    with inverse distance squared weighting factors; a station with the data itself is listed alone,
+    at 1.000. The nearest are found through a StationIndex for each section, so a lookup stays fast
+    with any number of stations.'''
+    
+    def __init__(self, stations, neighbours=CATALOG_NEIGHBOURS):
+        self.stations = stations
+        self.neighbours = neighbours
+        self.by_name = dict((s['station'].upper(), s) for s in stations)
+        self.indexes = {}
+        for section, heading in INTERPOLATED:
+            members = [s for s in stations if section in s['sections']]
+            self.indexes[section] = (members, StationIndex([s['latitude'] for s in members], [s['longitude'] for s in members]))
+    
+    def lookup(self, station_name):
+        '''The catalog row of a station, by the name its input gives it, None if it isn't there'''
+        return self.by_name.get(os.path.basename(station_name).split('.')[0].upper())
+    
+    def weights(self, latitude, longitude, section):
+        '''(station row, weighting factor) of the nearest stations with the data of section'''
+        members, index = self.indexes[section]
+        near = index.query(latitude, longitude, self.neighbours)
+        if near and near[0][1] < 1e-6:
+            return [(members[near[0][0]], 1.0)]
+        inverse = [1/(d*d) for i, d in near]
+        return [(members[i], w/sum(inverse)) for (i, d), w in zip(near, inverse)]
+    
+    def fill(self, params):
+        '''Sets the header and interpolated sections of params (Parameters) from the catalog row of
+        its station; returns that row, or None (leaving params as it is) if the station isn't there'''
+        row = self.lookup(params.station)
+        if row is None:
+            return None
+        params.station = row['name']
+        params.station_id = row['station_id'] or params.station_id
+        params.latitude = round(row['latitude'], 2)
+        params.longitude = round(row['longitude'], 2)
+        params.elevation = '%d' % round(row['elevation'])
+        params.interpolated = dict((section, [(s['name'], s['station_id'], w) for s, w in self.weights(row['latitude'], row['longitude'], section)])
+                                   for section, heading in INTERPOLATED)
+        return row
+    
+def load_catalog(path, neighbours=CATALOG_NEIGHBOURS):
+    '''Reads the station catalog '.csv' path into a StationCatalog'''
+    stations = []
+    with open(path, 'rb') as f:
+        for row in csv.DictReader(f):
+            station = row['station'].strip()
+            sections = (row.get('sections') or '').split()
+            stations.append({'station':station, 'name':(row.get('name') or '').strip() or station,
+                             'station_id':(row.get('station_id') or '').strip(), 'latitude':float(row['latitude']),
+                             'longitude':float(row['longitude']), 'elevation':float(row.get('elevation') or 0),
+                             'sections':sections or [section for section, heading in INTERPOLATED]})
+    return StationCatalog(stations, neighbours)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _parse_floats(values):
+    '''Returns a float array from a column of strings, with nan where a value is blank or not a number'''
+    if not len(values):
+        return np.zeros(0)
+    arr = np.asarray(values)
+    blank = arr == ''
+    if blank.any():
+        arr = np.where(blank, 'nan', arr)
+    try:
+        return arr.astype(float)
+    except ValueError:
+        return np.array([_to_float(v) for v in values])
+
+def _parse_dates(values):
+    '''Returns year, month, day and minute of the day arrays from a column of "mm/dd/yyyy hh:mm" 
+    strings, with 0 where the date (or time) is blank or can't be parsed'''
+    parts = [v.split(" ") for v in values]
+    unique, inverse = np.unique([p[0] for p in parts], return_inverse=True)
+    ymd = np.zeros((len(unique), 3), dtype=int)
+    for i, date in enumerate(unique):
+        parsed = dateparse(date)
+        try:
+            ymd[i] = (int(parsed['y']), int(parsed['m']), int(parsed['d']))
+        except (TypeError, ValueError):
+            pass
+    ymd = ymd[inverse]
+    unique, inverse = np.unique([p[-1] if len(p) > 1 else '' for p in parts], return_inverse=True)
+    minutes = np.zeros(len(unique), dtype=int)
+    for i, hhmm in enumerate(unique):
+        try:
+            (hh,mm) = hhmm.split(":")
+            minutes[i] = int(hh)*60 + int(mm)
+        except ValueError:
+            pass
+    return ymd[:, 0], ymd[:, 1], ymd[:, 2], minutes[inverse]
+
+def read_columns(filereader, blocksize=100000, interval=INTERVAL):
+    '''Reads the climate '.csv' into typed column arrays, converting blocks of rows at a time.
+    
+    Returns a dictionary of numpy arrays: 'year', 'month', 'day' and 'minute' (of the day; 0 where the
+    datetime is blank),
+    'prcp' (in), 'temp' (deg F), 'humid' (percent), 'srad' (langleys), 'ws' (m/s) and 'wdir' 
+    (degrees from N), with nan where a value is blank or not a number. Records `interval` minutes
+    apart are added up to INTERVAL minutes first if they're finer (see resampled, _resample_columns).'''
+    reader = csv.reader(filereader)
+    header = reader.next()
+    width = len(header)
+    index = [header.index(c) for c in COLUMNS]
+    blocks = dict((c, []) for c in DATE_COLUMNS + COLUMNS[1:])
+    while True:
+        block = list(islice(reader, blocksize))
+        if not block:
+            break
+        #blank lines are skipped, short rows are padded with blank fields (as csv.DictReader does)
+        block = [r if len(r) == width else (r + [''] * width)[:width] for r in block if r]
+        if not block:
+            continue
+        fields = zip(*block)
+        for c, i in zip(COLUMNS, index):
+            if c == 'datetime':
+                for key, arr in zip(DATE_COLUMNS, _parse_dates(fields[i])):
+                    blocks[key].append(arr)
+            else:
+                blocks[c].append(_parse_floats(fields[i]))
+    
+    cols = {}
+    for key, arrs in blocks.items():
+        cols[key] = np.concatenate(arrs) if arrs else np.zeros(0, dtype=int if key in DATE_COLUMNS else float)
+    return _convert_units(_resample_columns(cols, interval))
+
+def _convert_units(cols):
+    #c    %    w/m2    m/s    mm    degrees
+    cols['prcp'] = cols['prcp']/25.4 #mm to in
+    cols['temp'] = cols['temp']*1.8+32 #C to F
+    cols['srad'] = cols['srad']/0.484583 #w/m2 to lang
+    return cols
+
+def columns_from_arrays(arrays, interval=INTERVAL):
+    '''Returns the same arrays as read_columns() from climate records already in memory: a dictionary
+    with either 'datetime' ("mm/dd/yyyy hh:mm" strings) or 'year', 'month', 'day' and optionally
+    'minute' (of the day), and the other COLUMNS in the input units (deg C, percent, W/m2, m/s, mm,
+    degrees from N), nan or None where a value is missing. The records are `interval` minutes apart.'''
+    if 'datetime' in arrays:
+        cols = dict(zip(DATE_COLUMNS, _parse_dates([v or '' for v in arrays['datetime']])))
+    else:
+        cols = dict((c, np.asarray(arrays[c], dtype=int)) for c in ('year', 'month', 'day'))
+        cols['minute'] = np.asarray(arrays['minute'], dtype=int) if 'minute' in arrays else np.zeros(len(cols['month']), dtype=int)
+    for c in COLUMNS[1:]:
+        cols[c] = np.asarray(arrays[c], dtype=float)
+    return _convert_units(_resample_columns(cols, interval))
+
+def _resample_columns(cols, interval):
+    '''The columns (before the units are converted) of records `interval` minutes apart added up to
+    INTERVAL minutes like Resampler does, or cols as they are if they don't need to be'''
+    if resampled(interval) == interval or not len(cols['month']):
+        return cols
+    with np.errstate(all='ignore'):
+        return _resample_nonempty(cols)
+
+def _resample_nonempty(cols):
+    year, month, day, minute = cols['year'], cols['month'], cols['day'], cols['minute']
+    n = len(month)
+    dated = (month >= 1) & (month <= 12)
+    part = minute//INTERVAL
+    #a new record where the date or INTERVAL minutes change, and for each record without a date
+    change = ((year[1:] != year[:-1]) | (month[1:] != month[:-1]) | (day[1:] != day[:-1]) |
+              (part[1:] != part[:-1]) | ~dated[1:] | ~dated[:-1])
+    starts = np.concatenate(([0], np.flatnonzero(change) + 1))
+    group = np.cumsum(np.concatenate(([0], change)))
+    ngroups = len(starts)
+    
+    def total(values):
+        #sum of the values that are numbers in each record, left to right, and how many there are
+        ok = ~np.isnan(values)
+        counts = np.bincount(group[ok], minlength=ngroups)
+        return _reduce_runs(values[ok], counts, _sequential_sum), counts
+    
+    out = dict((c, cols[c][starts]) for c in ('year', 'month', 'day'))
+    out['minute'] = np.where(dated[starts], part[starts]*INTERVAL, minute[starts])
+    out['prcp'] = total(cols['prcp'])[0]
+    for c in RESAMPLED:
+        sums, counts = total(cols[c])
+        out[c] = sums/counts
+    wdir = cols['wdir']
+    with np.errstate(invalid='ignore'):
+        wdir = np.where((wdir >= 0.0) & (wdir <= 360.0), np.radians(wdir), np.nan)
+    u = total(np.sin(wdir))[0]
+    v = total(np.cos(wdir))[0]
+    out['wdir'] = np.degrees(np.arctan2(u, v)) % 360.0
+    return out
+
+
+COMPRESSED = ('.gz', '.bz2') #'.csv' inputs decompressed as they're read
+ARROW_INPUTS = ('.parquet', '.pq', '.arrow', '.feather') #columnar inputs, read with pyarrow
+INPUT_BUFFER = 1 << 20 #bytes decompressed at a time
+
+def is_compressed(fin):
+    return fin.lower().endswith(COMPRESSED)
+
+def is_arrow_input(fin):
+    return isinstance(fin, basestring) and fin.lower().endswith(ARROW_INPUTS)
+
+def open_input(fin):
+    '''Opens the climate '.csv' fin for reading. A '.csv.gz' or '.csv.bz2' is decompressed as it's
+    read, INPUT_BUFFER bytes at a time, so it's never written out uncompressed.'''
+    name = fin.lower()
+    if name.endswith('.gz'):
+        return io.BufferedReader(gzip.open(fin, 'rb'), INPUT_BUFFER)
+    if name.endswith('.bz2'):
+        return bz2.BZ2File(fin, 'rb', INPUT_BUFFER)
+    return open(fin, 'rb')
+
+def input_root(fin):
+    '''fin without its extension (and compression extension), eg. for the '.par' next to it'''
+    if is_compressed(fin):
+        fin = os.path.splitext(fin)[0]
+    return os.path.splitext(fin)[0]
+
+def arrow_arrays(fin, columns=COLUMNS):
+    '''The columns of the climate record in the Parquet, Arrow or Feather file fin, read with
+    pyarrow, as a dictionary of arrays for columns_from_arrays. The columns are named as in the '.csv';
+    datetime can be "mm/dd/yyyy hh:mm" text or a timestamp (which gives year, month, day and minute
+    arrays instead), and the other columns numbers or text.'''
+    if pyarrow is None:
+        raise ImportError('reading %s needs pyarrow, which is not installed' % fin)
+    name = fin.lower()
+    if name.endswith(('.parquet', '.pq')):
+        table = pyarrow.parquet.read_table(fin, columns=list(columns))
+    elif name.endswith('.feather'):
+        table = pyarrow.feather.read_table(fin, columns=list(columns))
+    else:
+        table = pyarrow.ipc.open_file(pyarrow.memory_map(fin)).read_all()
+    arrays = {}
+    for c in columns:
+        values = _arrow_values(table.column(c))
+        if c == 'datetime' and values.dtype.kind == 'M':
+            arrays.update(zip(DATE_COLUMNS, _timestamp_columns(values)))
+        elif c != 'datetime' and values.dtype.kind == 'O':
+            arrays[c] = _parse_floats(['' if v is None else v for v in values])
+        else:
+            arrays[c] = values
+    return arrays
+
+def _arrow_values(column):
+    #a pyarrow column as one numpy array, with nan, NaT or None for the nulls
+    chunks = [chunk.to_numpy(zero_copy_only=False) for chunk in column.chunks]
+    return np.concatenate(chunks) if chunks else np.zeros(0)
+
+def _timestamp_columns(stamps):
+    '''Returns year, month, day and minute of the day arrays from numpy datetime64 values, with 0
+    where a value is NaT'''
+    stamps = stamps.astype('datetime64[m]')
+    days = stamps.astype('datetime64[D]')
+    months = stamps.astype('datetime64[M]')
+    years = stamps.astype('datetime64[Y]')
+    cols = (years.astype(int) + 1970, (months - years).astype(int) + 1, (days - months).astype(int) + 1,
+            (stamps - days).astype(int))
+    nat = np.isnat(stamps)
+    for arr in cols:
+        arr[nat] = 0
+    return cols
+
+def read_input(fin, interval=INTERVAL):
+    '''Returns read_columns() for the climate record in the file fin: a '.csv' (which can be
+    compressed, see open_input) or a Parquet or Arrow file (see arrow_arrays)'''
+    if is_arrow_input(fin):
+        return columns_from_arrays(arrow_arrays(fin), interval)
+    with open_input(fin) as filereader:
+        return read_columns(filereader, interval=interval)
+
+
+CACHE_VERSION = 2
+
+def _file_hash(fin, blocksize=1 << 20):
+    digest = hashlib.sha1()
+    with open(fin, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _cache_key(fin, interval=INTERVAL):
+    st = os.stat(fin)
+    return {'version':CACHE_VERSION, 'path':os.path.abspath(fin), 'size':st.st_size, 'mtime':st.st_mtime, 'interval':interval}
+
+def cache_entry(fin, cache):
+    '''Directory in the cache directory holding the parsed columns of the input fin'''
+    path = os.path.abspath(fin)
+    name = os.path.basename(path).split('.')[0]
+    return os.path.join(cache, '%s-%s' % (name, hashlib.sha1(path).hexdigest()[:12]))
+
+def _write_meta(entry, meta):
+    #meta.json is replaced in one step, so a half written one is never read
+    meta_path = os.path.join(entry, 'meta.json')
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=1, sort_keys=True)
+    os.rename(meta_path + '.tmp', meta_path)
+
+def _load_cached(entry, key):
+    try:
+        with open(os.path.join(entry, 'meta.json')) as f:
+            meta = json.load(f)
+        if any(meta[k] != v for k, v in key.items() if k != 'mtime'):
+            return None
+        if meta['mtime'] != key['mtime']:
+            #same size but touched or written again: only a change if the content changed
+            if meta['sha1'] != _file_hash(key['path']):
+                return None
+            meta['mtime'] = key['mtime']
+            _write_meta(entry, meta)
+        cols = {}
+        for c in meta['columns']:
+            path = os.path.join(entry, c + '.npy')
+            #an empty file can't be memory mapped
+            cols[c] = np.load(path, mmap_mode='r') if meta['rows'] else np.load(path)
+        return cols
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+def load_columns(fin, cache=None, interval=INTERVAL):
+    '''Returns read_input() for the input fin of records `interval` minutes apart. With a cache
+    directory, the parsed and converted (and resampled) columns are saved there as one '.npy' per
+    column and later runs memory map them instead of reading the input again.
+
+    A cache entry is keyed on the input's path, size, mtime, sha1 and interval, and is rebuilt when
+    any of them (or CACHE_VERSION) changes. An input with the size and mtime of its entry is taken as
+    unchanged without reading it; only one with a new mtime is hashed, and its entry kept (with the
+    new mtime) if the sha1 is the same. meta.json is written last, so an entry left half written by
+    an interrupted run is never used.'''
+    if cache is None:
+        return read_input(fin, interval)
+
+    entry = cache_entry(fin, cache)
+    key = _cache_key(fin, interval)
+    cols = _load_cached(entry, key)
+    if cols is not None:
+        return cols
+
+    sha1 = _file_hash(fin)
+    cols = read_input(fin, interval)
+    if not os.path.isdir(entry):
+        os.makedirs(entry)
+    meta_path = os.path.join(entry, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for c, arr in cols.items():
+        np.save(os.path.join(entry, c + '.npy'), arr)
+    _write_meta(entry, dict(key, sha1=sha1, rows=len(cols['month']), columns=sorted(cols)))
+    return cols
+
+
+def _group(values, keys, ngroups):
+    '''Splits values into ngroups arrays by integer key (0 to ngroups-1), keeping their order'''
+    order = np.argsort(keys, kind='mergesort')
+    counts = np.bincount(keys, minlength=ngroups)
+    return np.split(np.asarray(values)[order], np.cumsum(counts)[:-1])
+
+def _by_month(values, months):
+    '''Splits values into arrays for each month ('1'-'12'), keeping their order'''
+    parts = _group(values, months, 13)
+    return dict((str(m), parts[m]) for m in range(1, 13))
+
+def _reduce_runs(values, lengths, reducer):
+    '''Applies reducer along axis 1 to the consecutive runs of values with the given lengths. Runs 
+    of the same length are reduced together, so each run is reduced in the same order as a call on
+    that run alone would (empty runs give nan)'''
+    out = np.empty(len(lengths))
+    out.fill(np.nan)
+    starts = np.cumsum(lengths) - lengths
+    for size in np.unique(lengths):
+        if size == 0:
+            continue
+        sel = np.flatnonzero(lengths == size)
+        out[sel] = reducer(values[starts[sel, None] + np.arange(size)])
+    return out
+
+def _sequential_sum(runs):
+    #left to right like sum()
+    return np.cumsum(runs, axis=1)[:, -1]
+
+def _mean(runs):
+    return runs.mean(axis=1)
+
+def _round(values):
+    '''round() for arrays: halves are rounded away from zero'''
+    a = np.abs(values)
+    r = np.floor(a + 0.5)
+    r[r - a > 0.5] -= 1
+    return np.copysign(r, values)
+
+def _last_index(mask):
+    '''Index of the last True at or before each position of mask (-1 if there is none)'''
+    idx = np.where(mask, np.arange(len(mask)), -1)
+    return np.maximum.accumulate(idx) if len(idx) else idx
+
+def accumulate_columns(cols, gaps=None, interval=INTERVAL):
+    '''Returns the same daily and monthly values as accumulate_rows() from the arrays returned by 
+    read_columns(), using vectorized passes over the whole record instead of a loop over the rows.
+    
+    Like the per-row pass, the lists for each day leave out the row that starts the day (except on
+    the first day), a day is filed under the month of the row that starts the next day, and the last
+    day of the record is never filed. The storms are split with each of the dry gaps, and interval is
+    the one of the input records (the arrays having been resampled by read_columns), as with
+    accumulate_rows().'''
+    with np.errstate(all='ignore'):
+        return _accumulate_columns(cols, gaps, resampled(interval))
+
+def _accumulate_columns(cols, gaps=None, step=INTERVAL):
+    rec = _record_columns(cols)
+    acc = _daily_columns(rec, step)
+    tables = [_storm_columns(rec, gap, step) for gap in gaps or window_steps(step)[2:]]
+    acc['ttp'] = tables[0].ttp
+    acc['storms'] = dict((t.gap, t) for t in tables)
+    return acc
+
+def _record_columns(cols):
+    '''The rows of the record with a datetime and precip, and the precip of every time step'''
+    month = cols['month']
+    valid = (month >= 1) & (month <= 12) & ~np.isnan(cols['prcp'])
+    #rows without a datetime or precip only push 0 through the precip windows
+    p_all = np.where(valid, cols['prcp'], 0.0)
+    rows = np.flatnonzero(valid)
+    rec = dict((c, cols[c][rows]) for c in ('year', 'day', 'minute', 'temp', 'humid', 'srad', 'ws', 'wdir'))
+    rec.update(total=len(month), p_all=p_all, rows=rows, m=month[rows], p=p_all[rows])
+    return rec
+
+def _daily_columns(rec, step=INTERVAL):
+    '''The daily and per-row monthly values of accumulate_columns(), all but the storms, for records
+    `step` minutes apart'''
+    samples, readings, acc = _daily_samples(rec, step)
+    for name, (values, months, years) in samples.items():
+        if name == 'calm':
+            calm = np.bincount(months, values, minlength=13).astype(int)
+            windy = np.bincount(months, minlength=13) - calm
+            acc['calm'] = dict((str(i), [int(calm[i]), int(windy[i])]) for i in range(1, 13))
+        else:
+            acc[name] = _by_month(values, months)
+    return acc
+
+def _daily_samples(rec, step=INTERVAL):
+    '''The samples behind the monthly values of _daily_columns as (values, month, year) arrays by 
+    name, each value with the month and year it's filed under: the daily precip of the ww, wd and dd
+    days, the daily tempmax, tempmin, srad and prcp30_max, and the dew point and calm (1 for a calm
+    reading, 0 for a windy one) of each row. Returned with the readings behind the values of the
+    record as a whole, by name: the 30 minute and 6 hour precip of each row (prcp30, prcp6) as
+    (values, month, year) and the wind readings as (speed, month, year, sector), and those values.'''
+    p_all, rows, m, d, p = rec['p_all'], rec['rows'], rec['m'], rec['day'], rec['p']
+    temp, humid, srad, ws, wdir = rec['temp'], rec['humid'], rec['srad'], rec['ws'], rec['wdir']
+    n = len(rows)
+    steps30, steps6, gap = window_steps(step)
+    
+    #days
+    newday = np.flatnonzero(d[1:] != d[:-1]) + 1
+    starts = np.concatenate(([0], newday)).astype(int)
+    ndays = len(starts)
+    filed = m[newday] #month each finished day is filed under
+    filedyear = rec['year'][newday]
+    first = np.zeros(n, dtype=bool)
+    first[newday] = True
+    dayid = np.cumsum(first)
+    member = ~first
+    
+    #daily precip and wet/dry transitions
+    daysum = _reduce_runs(p[member], np.bincount(dayid[member], minlength=ndays), _sequential_sum)
+    daysum[np.isnan(daysum)] = 0.0
+    wet = daysum[:-1] > 0
+    prevwet = np.concatenate(([False], wet[:-1]))
+    daysum = daysum[:-1]
+    samples = {}
+    for name, days in (('ww', wet & prevwet), ('wd', wet & ~prevwet), ('dd', ~wet)):
+        samples[name] = (daysum[days], filed[days], filedyear[days])
+    
+    #daily max and min temperature; a day with a missing temperature has no max
+    tmin = np.fmin.reduceat(temp, starts)[:-1] if n else np.zeros(0)
+    tmax = np.maximum.reduceat(temp, starts)[:-1] if n else np.zeros(0)
+    minok = ~np.isnan(tmin)
+    maxok = minok & ~np.isnan(tmax)
+    samples['tempmin'] = (_round(tmin[minok]), filed[minok], filedyear[minok])
+    samples['tempmax'] = (_round(tmax[maxok]), filed[maxok], filedyear[maxok])
+    
+    #daily mean solar radiation
+    sradok = member & ~np.isnan(srad)
+    sradmean = _reduce_runs(srad[sradok], np.bincount(dayid[sradok], minlength=ndays), _mean)[:-1]
+    sradok = ~np.isnan(sradmean)
+    samples['srad'] = (sradmean[sradok], filed[sradok], filedyear[sradok])
+    
+    #30 minute precip, the first row of the record doesn't count towards the daily max
+    p30 = p_all.copy()
+    for k in range(1, steps30):
+        p30[k:] += p_all[:-k]
+    p30 = p30[rows]
+    if n:
+        p30[0] = 0.0
+    prcp30_record = max(0.0, float(p30.max())) if n else 0
+    daymax30 = np.maximum(np.maximum.reduceat(p30, starts)[:-1], 0.0) if n else np.zeros(0)
+    wet30 = daymax30 > 0
+    samples['prcp30_max'] = (daymax30[wet30]/(steps30*step/60.0), filed[wet30], filedyear[wet30])
+    
+    #6 hour precip, summed in the same order as the per-row pass
+    p6 = p_all.copy()
+    for k in range(1, steps6):
+        p6[k:] += p_all[:-k]
+    prcp6_record = max(0.0, float(p6[rows].max())) if n else 0
+    
+    #dew point (simple approx), rows where it can't be computed are masked and left out
+    dew = dew_points(temp, humid)
+    dewok = ~np.ma.getmaskarray(dew)
+    samples['dew'] = (dew.data[dewok], m[dewok], rec['year'][dewok])
+    
+    #calm
+    wsok = ~np.isnan(ws)
+    samples['calm'] = ((ws[wsok] <= 0.3).astype(float), m[wsok], rec['year'][wsok])
+    
+    #wind, a row with a missing wind direction keeps the last one read, and a row missing
+    #any of temp, humid, srad or ws keeps the last wind speed and direction read
+    sector = windSectors(wdir)
+    last = _last_index(~np.isnan(wdir))
+    sector = np.where(last >= 0, sector[np.maximum(last, 0)], NA_SECTOR)
+    src = _last_index(~np.isnan(temp) & ~np.isnan(humid) & ~np.isnan(srad) & wsok)
+    has = src >= 0
+    wind = WindRose()
+    wind.add(m[has], sector[src[has]], ws[src[has]])
+    
+    readings = {'prcp30':(p30, m, rec['year']), 'prcp6':(p6[rows], m, rec['year']),
+                'wind':(ws[src[has]], m[has], rec['year'][has], sector[src[has]])}
+    return samples, readings, {'rows':rec['total'], 'daycount':len(newday), 'prcp30_record':prcp30_record,
+                     'prcp6_record':prcp6_record, 'wind':wind}
+
+def _storm_columns(rec, gap=STORM_GAP, step=INTERVAL):
+    '''StormTable of the storms split with the dry gap (its ttp is the time to peak by month of 
+    accumulate_columns()), for records `step` minutes apart'''
+    p_all, rows, m, p = rec['p_all'], rec['rows'], rec['m'], rec['p']
+    n = len(rows)
+    window = 2*gap
+    table = StormTable(gap, interval=step)
+    
+    #storms: a storm ends on the first row with `gap` dry time steps that still has precip in the
+    #window, ie. gap to window-1 time steps after its last wet one (4 to 7 for the 2 hour window)
+    total = len(p_all)
+    wetpos = np.flatnonzero(p_all != 0)
+    nextwet = np.append(wetpos[1:], total + window)
+    lo = wetpos + gap
+    hi = np.minimum(np.minimum(wetpos + window - 1, nextwet - 1), total - 1)
+    if n:
+        fire = np.minimum(np.searchsorted(rows, lo), n - 1)
+        fire = fire[(rows[fire] >= lo) & (rows[fire] <= hi)]
+    else:
+        fire = np.zeros(0, dtype=int)
+    if not len(fire):
+        table.ttp = _by_month(np.zeros(0), np.zeros(0, dtype=int))
+        return table
+    
+    #the time counter restarts on the row that ends each storm, time to peak is counted
+    #to the first row holding the storm max
+    base = np.concatenate(([0], fire[:-1]))
+    segstart = np.concatenate(([0], fire[:-1] + 1))
+    seg = np.searchsorted(fire, np.arange(fire[-1] + 1))
+    segmax = np.maximum.reduceat(p[:fire[-1] + 1], segstart)
+    peak = np.flatnonzero((p[:fire[-1] + 1] == segmax[seg]) & (segmax[seg] > 0))
+    peakseg, firstpeak = np.unique(seg[peak], return_index=True)
+    tmaxrow = base.copy()
+    tmaxrow[peakseg] = peak[firstpeak]
+    tf = fire - base - gap
+    #a storm with tf of 0 only had one 15 min precip event recorded
+    ok = tf != 0
+    ttp = (tmaxrow - base).astype(float)/np.where(ok, tf, 1)
+    table.ttp = _by_month(ttp[ok], m[fire[ok]])
+    
+    #the rest of the table: first and last wet rows, depth and the largest 30 minute precip
+    wet = np.flatnonzero(p != 0)
+    first = wet[np.searchsorted(wet, segstart)]
+    last = wet[np.searchsorted(wet, fire, 'right') - 1]
+    depth = _reduce_runs(p[:fire[-1] + 1], fire - segstart + 1, _sequential_sum)
+    #added up oldest first, like StormDetector
+    p30 = np.zeros(len(p_all))
+    for k in reversed(range(window_steps(step)[0])):
+        p30[k:] += p_all[:len(p_all) - k]
+    p30max = np.maximum(np.maximum.reduceat(p30[rows][:fire[-1] + 1], segstart), 0.0)
+    year, day, minute = rec['year'], rec['day'], rec['minute']
+    start = zip(year[first].tolist(), m[first].tolist(), day[first].tolist(), (minute[first]//60).tolist(), (minute[first] % 60).tolist())
+    end = zip(year[last].tolist(), m[last].tolist(), day[last].tolist(), (minute[last]//60).tolist(), (minute[last] % 60).tolist())
+    table.rows = zip(start, end, m[fire].tolist(), (rows[last] - rows[first] + 1).tolist(), depth.tolist(),
+                     (segmax/table.hours[0]).tolist(), (p30max/table.hours[1]).tolist(), (rows[tmaxrow] - rows[first]).tolist(),
+                     [t if k else None for t, k in zip(ttp.tolist(), ok.tolist())])
+    table.count = len(fire)
+    return table
+
+BOOTSTRAP_SEED = 0
+BOOTSTRAP_FIELDS = ('parameter', 'month', 'value', 'lower', 'upper', 'std_err', 'replicates')
+#'.par' parameters with bootstrap intervals, in the order they're written (see _bootstrap_stats)
+BOOTSTRAP_PARAMS = ('MEAN P', 'S DEV P', 'SKEW P', 'P(W/W)', 'P(W/D)', 'TMAX AV', 'TMIN AV', 'SD TMAX', 'SD TMIN',
+                    'SOL.RAD', 'SD SOL', 'MX .5 P', 'DEW PT', 'Time Pk', 'CALM')
+
+class BootstrapTable(object):
+    '''Bootstrap confidence intervals of the monthly parameters of a '.par' (see bootstrap_params).
+    A row for each parameter (BOOTSTRAP_PARAMS) and month (see BOOTSTRAP_FIELDS):
+    parameter   '.par' label
+    month       1-12
+    value       the parameter from the whole record (None where it can't be computed)
+    lower, upper  percentile interval of the replicates at the level (eg. their 2.5% and 97.5%
+                points for 0.95)
+    std_err     std dev of the replicates
+    replicates  replicates the parameter could be computed from (a replicate can leave out all the
+                years with values for the month, eg. with storms in it)
+    
+    The wind blocks (by direction) aren't bootstrapped.'''
+    
+    def __init__(self, replicates, seed, level, years):
+        self.replicates = replicates
+        self.seed = seed
+        self.level = level
+        self.years = years
+        self.rows = []
+    
+    def write(self, o):
+        '''Writes the rows to the open '.csv' file o'''
+        writer = csv.writer(o)
+        writer.writerow(BOOTSTRAP_FIELDS)
+        for label, month, value, lower, upper, se, count in self.rows:
+            writer.writerow([label, month] + ['' if v is None else '%.4f' % v for v in (value, lower, upper, se)] + [count])
+
+def _year_sums(values, cells, years, nyears, ncells=12):
+    '''Count, sum and sum of squares of the values by cell (eg. month - 1) and year ((ncells, nyears)
+    arrays, each value taken from the mean of its cell so the sums of squares stay small) and those
+    means'''
+    key = cells*nyears + years
+    n = np.bincount(key, minlength=ncells*nyears).astype(float)
+    s = np.bincount(key, values, minlength=ncells*nyears)
+    counts = n.reshape(ncells, nyears).sum(axis=1)
+    centre = np.where(counts > 0, s.reshape(ncells, nyears).sum(axis=1)/np.maximum(counts, 1), 0.0)
+    dev = values - centre[cells]
+    s1 = np.bincount(key, dev, minlength=ncells*nyears)
+    s2 = np.bincount(key, dev*dev, minlength=ncells*nyears)
+    return n.reshape(ncells, nyears), s1.reshape(ncells, nyears), s2.reshape(ncells, nyears), centre
+
+def _sorted_cells(values, cells, years, ncells=12):
+    #the values of each cell sorted, with the year of each
+    order = np.argsort(values)
+    order = order[np.argsort(cells[order], kind='mergesort')]
+    bounds = np.searchsorted(cells[order], np.arange(ncells + 1))
+    return [(values[order[a:b]], years[order[a:b]]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+def _weighted_medians(weights, values, years):
+    #median of the sorted values, each repeated by the weight of its year, for each row of weights
+    out = np.empty(len(weights))
+    out.fill(np.nan)
+    if not len(values):
+        return out
+    cum = np.cumsum(weights[:, years], axis=1)
+    total = cum[:, -1]
+    lo = (cum > ((total - 1)//2)[:, None]).argmax(axis=1)
+    hi = (cum > (total//2)[:, None]).argmax(axis=1)
+    ok = total > 0
+    out[ok] = (values[lo] + values[hi])[ok]/2.0
+    return out
+
+def _moments(total, sums):
+    #count, mean and std dev of each set of years from the sums of _year_sums, total giving the
+    #(sets, cells) totals of a (cells, years) array
+    n, s1, s2, centre = sums
+    count = total(n)
+    mean = total(s1)/count
+    square = total(s2)/count
+    var = square - mean**2
+    var[var <= 1e-12*square] = 0.0 #values that are all the same, but for rounding
+    return count, centre + mean, np.sqrt(np.maximum(var, 0.0))
+
+def _monthly_stats(total, weights, sums, wet):
+    '''The parameters (BOOTSTRAP_PARAMS, each a (sets, 12) array, nan where one can't be computed) of
+    sets of years: total gives the (sets, 12) totals of a (12, years) array of sums by month and year
+    (see _summed), and a row of weights how many times each year counts in a set (for the median of
+    SKEW P)'''
+    with np.errstate(all='ignore'):
+        def moments(name):
+            return _moments(total, sums[name])
+        count, mean_p, sdev_p = moments('wet')
+        median_p = np.column_stack([_weighted_medians(weights, values, years) for values, years in wet])
+        days = count + moments('dd')[0]
+        tmax_av, sd_tmax = moments('tempmax')[1:]
+        tmin_av, sd_tmin = moments('tempmin')[1:]
+        sol_rad, sd_sol = moments('srad')[1:]
+        return [mean_p, sdev_p, 3*(mean_p - median_p)/sdev_p, moments('ww')[0]/days, moments('wd')[0]/days,
+                tmax_av, tmin_av, sd_tmax, sd_tmin, sol_rad, sd_sol, moments('prcp30_max')[1], moments('dew')[1],
+                moments('ttp')[1], 100*moments('calm')[1]]
+
+def _bootstrap_stats(job):
+    '''The parameters (BOOTSTRAP_PARAMS, each a (replicates, 12) array, nan where one can't be
+    computed) of each replicate, a row of weights giving how many times each year was drawn'''
+    weights, sums, wet = job
+    weights = np.asarray(weights, dtype=float)
+    return _monthly_stats(lambda a: weights.dot(a.T), weights, sums, wet)
+
+def _year_samples(cols, step=INTERVAL):
+    '''The samples of _daily_samples, with the time to peak of the storms (ttp) and the precip of
+    the wet days (wet, the ww and wd days together) added, and its readings, from the arrays of
+    read_columns() (records `step` minutes apart)'''
+    with np.errstate(all='ignore'):
+        rec = _record_columns(cols)
+        samples, readings, acc = _daily_samples(rec, step)
+        storms = _storm_columns(rec, window_steps(step)[2], step)
+    ttp = np.array([(row[8], row[2], row[0][0]) for row in storms.rows if row[8] is not None], dtype=float).reshape(-1, 3)
+    samples['ttp'] = (ttp[:, 0], ttp[:, 1].astype(int), ttp[:, 2].astype(int))
+    samples['wet'] = tuple(np.concatenate(v) for v in zip(samples['ww'], samples['wd']))
+    return samples, readings
+
+def _summed(samples, years):
+    #the samples summed by month and year (_year_sums) by name, and the wet days of each month
+    #sorted, for the sorted array of years
+    sums = {}
+    for name, (values, months, labels) in samples.items():
+        sums[name] = _year_sums(values, months - 1, np.searchsorted(years, labels), len(years))
+    values, months, labels = samples['wet']
+    return sums, _sorted_cells(values, months - 1, np.searchsorted(years, labels))
+
+def bootstrap_params(cols, replicates=1000, seed=BOOTSTRAP_SEED, jobs=None, level=0.95, interval=INTERVAL):
+    '''Bootstrap confidence intervals of the monthly parameters of the '.par' from the arrays of
+    read_columns() (records `interval` minutes apart), as a BootstrapTable.
+    
+    Each replicate draws as many years as the record has, with replacement, from its years (the year
+    each daily value, row or storm is filed under, like its month) and works out the parameters from
+    the values of the years drawn. The days aren't aggregated again: the daily series and the storms
+    are summed by month and year once, and the replicates are weighted sums of those, worked out
+    together as matrix products (with a weighted rank for the median of SKEW P). The replicates are
+    split over `jobs` worker processes (one per cpu by default); the years drawn come from seed
+    before they're split, so the intervals don't depend on the number of jobs.'''
+    samples, readings = _year_samples(cols, resampled(interval))
+    years = np.unique(np.concatenate([years for values, months, years in samples.values()]))
+    if not len(years):
+        raise ValueError('the record has no days to resample')
+    sums, wet = _summed(samples, years)
+    
+    rng = np.random.RandomState(seed)
+    draws = rng.randint(0, len(years), (replicates, len(years))) + len(years)*np.arange(replicates)[:, None]
+    weights = np.bincount(draws.ravel(), minlength=replicates*len(years)).reshape(replicates, len(years))
+    jobs = min(jobs or multiprocessing.cpu_count(), replicates)
+    blocks = [(w, sums, wet) for w in np.array_split(weights, jobs)]
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, _batch_init)
+        try:
+            parts = pool.map(_bootstrap_stats, blocks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        parts = [_bootstrap_stats(block) for block in blocks]
+    whole = _bootstrap_stats((np.ones((1, len(years))), sums, wet))
+
+    table = BootstrapTable(replicates, seed, level, len(years))
+    tails = (50*(1 - level), 50*(1 + level))
+    for k, label in enumerate(BOOTSTRAP_PARAMS):
+        stats = np.concatenate([part[k] for part in parts])
+        for m in range(12):
+            value = whole[k][0, m]
+            reps = stats[:, m][np.isfinite(stats[:, m])]
+            if len(reps):
+                lower, upper = np.percentile(reps, tails)
+                table.rows.append((label, m + 1, value if np.isfinite(value) else None, lower, upper, float(np.std(reps)), len(reps)))
+            else:
+                table.rows.append((label, m + 1, value if np.isfinite(value) else None, None, None, None, 0))
+    return table
+
+
+def window_name(fout, first, last):
+    '''File name of the '.par' for the years first to last in a moving window run: fout with
+    _<first>-<last> before the extension'''
+    base, ext = os.path.splitext(fout)
+    return '%s_%d-%d%s' % (base, first, last, ext)
+
+def _window_totals(a, starts, ends):
+    #totals of a (cells, years) array over the years from starts to ends (exclusive) of each window,
+    #as a (windows, cells) array: the differences of its running totals at the two ends
+    cum = np.concatenate((np.zeros((len(a), 1)), np.cumsum(a, axis=1)), axis=1)
+    return (cum[:, ends] - cum[:, starts]).T
+
+def window_params(cols, years, step=1, station_name='', interval=INTERVAL, catalog=None):
+    '''Parameters of every `years` long window of calendar years of the record from the arrays of
+    read_columns() (records `interval` minutes apart), the first starting with its first year and
+    each next one `step` years later, as a list of (first year, last year, Parameters).
+    
+    A window is made of the days, rows and storms filed under its years (like their month), so its
+    parameters are those of a run over just those years but for the odd day or storm at its ends.
+    The record is only gone over once: the daily series, rows, storms and wind readings are summed
+    by month (and direction) and year, and the counts, means and std devs of a window are worked out
+    from the differences of the running totals of those sums at its ends, so a window costs the
+    same whatever its length. TP5 and TP6 are the largest of the yearly largest values. A median
+    (for SKEW P and the skew of each wind direction) can't be made up from sums: the values of each
+    month (and direction) are sorted once, with the year of each, and the median of every window is
+    found together by rank, from running counts of the values of its years in that order. With a
+    StationCatalog, the header and interpolated sections come from the station's row in it.'''
+    samples, readings = _year_samples(cols, resampled(interval))
+    labels = np.concatenate([labels for values, months, labels in samples.values()])
+    if not len(labels):
+        raise ValueError('the record has no days to make windows of')
+    record = np.arange(labels.min(), labels.max() + 1)
+    if years < 1 or step < 1 or len(record) < years:
+        raise ValueError('the record has %d years, it can\'t be split into windows of %s years' % (len(record), years))
+    starts = np.arange(0, len(record) - years + 1, step)
+    ends = starts + years
+    inside = ((np.arange(len(record)) >= starts[:, None]) & (np.arange(len(record)) < ends[:, None])).astype(float)
+    def total(a):
+        return _window_totals(a, starts, ends)
+    
+    with np.errstate(all='ignore'):
+        #monthly parameters, and the calm readings counted so they round as in compute_params
+        sums, wet = _summed(samples, record)
+        monthly = dict(zip(BOOTSTRAP_PARAMS, _monthly_stats(total, inside, sums, wet)))
+        winds = _moments(total, sums['calm'])[0]
+        calm = np.round(monthly['CALM']*winds/100)
+        days = sum(total(sums[name][0]) for name in ('ww', 'wd', 'dd')).sum(axis=1)
         
+        #rows and the largest 30 minute and 6 hour precip of each year
+        peaks = {}
+        for name in ('prcp30', 'prcp6'):
+            values, months, labels = readings[name]
+            yearly = np.searchsorted(record, labels)
+            peaks[name] = np.zeros(len(record))
+            np.fmax.at(peaks[name], yearly, values)
+        dated = cols['year'][(cols['month'] >= 1) & (cols['month'] <= 12)]
+        dated = dated[(dated >= record[0]) & (dated <= record[-1])] - record[0]
+        rows = total(np.bincount(dated, minlength=len(record))[None, :].astype(float))[:, 0]
         
+        #wind by month and direction
+        speeds, months, labels, sectors = readings['wind']
+        yearly = np.searchsorted(record, labels)
+        readings_of = total(np.bincount((months - 1)*len(record) + yearly, minlength=12*len(record)).reshape(12, len(record)).astype(float))
+        ok = sectors != NA_SECTOR
+        cells = (months[ok] - 1)*len(DIRECTIONS) + sectors[ok]
+        ncells = 12*len(DIRECTIONS)
+        wcount, wmean, wstd = _moments(total, _year_sums(speeds[ok], cells, yearly[ok], len(record), ncells))
+        wmedian = np.column_stack([_weighted_medians(inside, v, y) for v, y in _sorted_cells(speeds[ok], cells, yearly[ok], ncells)])
+        wskew = 3*(wmean - wmedian)/wstd
+        wpct = wcount/np.repeat(readings_of, len(DIRECTIONS), axis=1)*100
+    
+    windows = []
+    for k, (a, b) in enumerate(zip(starts, ends)):
+        params = _new_params(station_name, int(rows[k]), int(days[k]), peaks['prcp30'][a:b].max(), peaks['prcp6'][a:b].max())
+        for name, label, fmt in PAR_MONTHLY:
+            setattr(params, name, _listed(monthly[label][k]))
+        params.calm = [round(float(c)/n*100, 2) if n else None for c, n in zip(calm[k], winds[k])]
+        #mean, std dev and skew of the precip together, as in compute_params
+        for m in range(12):
+            if params.skew_p[m] is None:
+                params.mean_p[m] = params.sdev_p[m] = None
+        params.wind = dict((key, []) for key in DIRECTIONS)
+        for m in range(12):
+            for s, key in enumerate(DIRECTIONS):
+                cell = m*len(DIRECTIONS) + s
+                stats = (wpct[k, cell], wmean[k, cell], wstd[k, cell], wskew[k, cell])
+                params.wind[key].append(tuple(float(v) for v in stats) if np.all(np.isfinite(stats)) else None)
+        if catalog is not None:
+            catalog.fill(params)
+        windows.append((int(record[a]), int(record[b - 1]), params))
+    return windows
+
+
+def _minutes(timestamp):
+    #minutes since 1970 of a (year, month, day, hour, minute), None if it isn't a date
+    try:
+        return calendar.timegm(timestamp + (0,))//60
+    except (TypeError, ValueError):
+        return None
+
+def detect_interval(source, records=1000):
+    '''Minutes between the climate records of source (an input file name or open '.csv' file, or a
+    dictionary of arrays, see columns_from_arrays): the most common time from one record to the next
+    over the first `records`, so logger gaps don't count. An open file is read from where it is and
+    put back there. INTERVAL when it can't be told (eg. an open file that can't seek, or fewer than
+    two records with a datetime) or isn't 1 to 60 minutes, as the times were never checked before.'''
+    if is_arrow_input(source):
+        return detect_interval(arrow_arrays(source, ('datetime',)), records)
+    if isinstance(source, basestring):
+        with open_input(source) as filereader:
+            return detect_interval(filereader, records)
+    if isinstance(source, dict):
+        if 'datetime' in source:
+            stamps = [_timestamp(v) for v in islice(source['datetime'], records)]
+        elif 'minute' in source:
+            stamps = [(int(y), int(m), int(d), int(i)//60, int(i) % 60) for y, m, d, i in
+                      islice(zip(source['year'], source['month'], source['day'], source['minute']), records)]
+        else:
+            return INTERVAL
+    else:
+        try:
+            start = source.tell()
+            stamps = [_timestamp(row['datetime']) for row in islice(csv.DictReader(source), records)]
+            source.seek(start)
+        except (AttributeError, IOError):
+            return INTERVAL
+    minutes = [m for m in map(_minutes, stamps) if m is not None]
+    steps = Counter(b - a for a, b in zip(minutes[:-1], minutes[1:]) if b > a)
+    interval = steps.most_common(1)[0][0] if steps else INTERVAL
+    return interval if 1 <= interval <= 60 else INTERVAL
+
+
+ENGINES = ('rows', 'columnar', 'streaming')
+
+def accumulate(source, engine=None, rejected=None, gaps=None, interval=None):
+    '''Accumulates the daily and monthly values for compute_params() from climate records: a '.csv'
+    file name (which can be compressed, see open_input), an open '.csv' file, or a Parquet or Arrow
+    file name or dictionary of in-memory arrays (see arrow_arrays and columns_from_arrays, these
+    always use the columnar engine). The engine for a '.csv' defaults to rows. The rows and 
+    streaming engines count the records and values they leave out in rejected, if given.
+    
+    The records are `interval` minutes apart (by default detect_interval); finer ones are added up
+    to INTERVAL minutes as they're read (see resampled). The storms are split with each of the dry
+    gaps (time steps of the records worked on, by default an hour; the first one for the '.par'),
+    and their StormTables returned by gap in 'storms'.'''
+    if interval is None:
+        interval = detect_interval(source)
+    if isinstance(source, dict):
+        if engine not in (None, 'columnar'):
+            raise ValueError('in-memory arrays need the columnar engine, not %s' % engine)
+        return accumulate_columns(columns_from_arrays(source, interval), gaps, interval)
+    if is_arrow_input(source):
+        if engine not in (None, 'columnar'):
+            raise ValueError('Parquet and Arrow input need the columnar engine, not %s' % engine)
+        return accumulate_columns(read_input(source, interval), gaps, interval)
+    engine = engine or 'rows'
+    if engine not in ENGINES:
+        raise ValueError('unknown engine %s' % engine)
+    if isinstance(source, basestring):
+        with open_input(source) as filereader:
+            return accumulate(filereader, engine, rejected, gaps, interval)
+    if engine == 'columnar':
+        return accumulate_columns(read_columns(source, interval=interval), gaps, interval)
+    return accumulate_rows(csv.DictReader(source), OnlineStats if engine == 'streaming' else list, rejected, gaps, interval)
+
+def storm_gap(interval=INTERVAL):
+    '''The dry gap (time steps) that ends a storm in the '.par' for records `interval` minutes apart'''
+    return window_steps(resampled(interval))[2]
+
+def station_name_of(fin):
+    '''Default station name for an input: its file name without the extension, in capitals'''
+    name = fin if isinstance(fin, basestring) else getattr(fin, 'name', '')
+    return os.path.basename(str(name)).split('.')[0].upper()
+
+class RunReport(object):
+    '''Opt-in instrumentation of a run of make_par or update_par: the wall time and rows per second 
+    of each stage, and (rows and streaming engines) counts by category of the records and values the
+    per-row pass leaves out or works around (see REJECTED). The columnar engine doesn't leave values
+    out through errors, so it has no counts (rejected is None).
+    
+    A stage that fails is recorded with its error, so a report can be saved for a failed run too.'''
+    
+    def __init__(self, **info):
+        self.info = info #eg. station, input and output
+        self.stages = [] #(stage, seconds)
+        self.rows = None
+        self.rejected = None
+        self.error = None
+    
+    def time(self, stage, f, *args):
+        '''Returns f(*args), timed as stage'''
+        start = time.time()
+        try:
+            return f(*args)
+        except Exception as e:
+            self.error = '%s: %s' % (type(e).__name__, e)
+            raise
+        finally:
+            self.stages.append((stage, time.time() - start))
+    
+    def as_dict(self):
+        def rate(seconds):
+            return self.rows/seconds if self.rows and seconds else None
+        seconds = sum(s for stage, s in self.stages)
+        report = dict(self.info, rows=self.rows, seconds=seconds, rows_per_sec=rate(seconds), error=self.error,
+                      stages=[{'stage':stage, 'seconds':s, 'rows_per_sec':rate(s)} for stage, s in self.stages])
+        if self.rejected is None:
+            report['rejected'] = None
+        else:
+            report['rejected'] = dict((category, self.rejected[category]) for category, meaning in REJECTED)
+        return report
+    
+    def save(self, path):
+        '''Writes the report as JSON to path (eg. the '.par' file name + '.json')'''
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1, sort_keys=True)
+
+def new_report(fin, fout, engine):
+    '''RunReport for a run writing the '.par' fout from the input fin'''
+    return RunReport(station=station_name_of(fin), input=str(fin), output=str(fout), engine=engine)
+
+def _timed(report, stage, f, *args):
+    return report.time(stage, f, *args) if report is not None else f(*args)
+
+def _write_params(fout, params):
+    if isinstance(fout, basestring):
+        #a parameter that's missing shouldn't leave an empty '.par' behind
+        par_text(params)
+        with open(fout, 'w') as o:
+            write_par(o, params)
+    else:
+        write_par(fout, params)
+
+def _write_storms(fout, table):
+    #the storm table goes next to the '.par'
+    if not isinstance(fout, basestring):
+        raise ValueError('the storm table needs the \'.par\' to be a file name')
+    if table is None:
+        raise ValueError('the storm table needs a single pass over the records (no jobs)')
+    with open(fout + '.storms.csv', 'wb') as o:
+        table.write(o)
+
+def _accumulate_input(fin, engine, cache, jobs, report, gaps, interval):
+    rejected = None
+    if report is not None:
+        report.info['interval'] = interval
+        if engine != 'columnar':
+            rejected = report.rejected = Counter()
+    if engine == 'columnar' and isinstance(fin, basestring):
+        cols = _timed(report, 'parse', load_columns, fin, cache, interval)
+        acc = _timed(report, 'accumulate', accumulate_columns, cols, gaps, interval)
+    elif jobs and engine != 'columnar':
+        acc = _timed(report, 'accumulate', accumulate_parallel, fin, jobs, OnlineStats if engine == 'streaming' else list, rejected, interval)
+    else:
+        acc = _timed(report, 'accumulate', accumulate, fin, engine, rejected, gaps, interval)
+    if report is not None:
+        report.rows = acc['rows']
+    return acc
+
+def make_par(fin, fout, engine='rows', station_name=None, cache=None, jobs=None, report=None, storms=False, interval=None, catalog=None):
+    '''Writes the '.par' file fout for the climate records fin and returns its Parameters: 
+    parse and accumulate (accumulate), compute_params() and write_par(). fin and fout can be file
+    names or open files, and fin a dictionary of arrays too (see accumulate).
+    
+    The columnar engine reads the parsed columns through the cache directory, if one is given. With
+    jobs, the rows and streaming engines split the records over that many worker processes. Both 
+    need fin to be a file name. The records are `interval` minutes apart, by default as detected
+    from the first ones (see detect_interval).
+    
+    With a RunReport, the stages are timed and the rejected records counted in it. With storms, the
+    StormTable is written next to the '.par' (fout + '.storms.csv'; rows and columnar engines). With
+    a StationCatalog, the header and interpolated sections come from the station's row in it.'''
+    if interval is None:
+        interval = detect_interval(fin)
+    gap = storm_gap(interval)
+    acc = _accumulate_input(fin, engine, cache, jobs, report, (gap,), interval)
+    if station_name is None:
+        station_name = station_name_of(fin)
+    params = _timed(report, 'compute', compute_params, acc, station_name, catalog)
+    _timed(report, 'write', _write_params, fout, params)
+    if storms:
+        _timed(report, 'storms', _write_storms, fout, acc['storms'] and acc['storms'][gap])
+    return params
+
+def sweep_name(fout, gap):
+    '''File name of the '.par' for a dry gap in a sweep: fout with _g<gap> before the extension'''
+    base, ext = os.path.splitext(fout)
+    return '%s_g%d%s' % (base, gap, ext)
+
+def make_sweep(fin, fout, gaps, engine='rows', station_name=None, cache=None, report=None, storms=False, interval=None, catalog=None):
+    '''Writes a '.par' for each of the dry gaps between storms in gaps (time steps) from one pass over
+    the climate records fin, named sweep_name(fout, gap), and returns their Parameters by gap. Only
+    the time to peak differs from one to the next. Otherwise like make_par.'''
+    gaps = tuple(gaps)
+    if interval is None:
+        interval = detect_interval(fin)
+    acc = _accumulate_input(fin, engine, cache, None, report, gaps, interval)
+    if station_name is None:
+        station_name = station_name_of(fin)
+    params = _timed(report, 'compute', sweep_params, acc, station_name, catalog)
+    for gap in gaps:
+        _timed(report, 'write', _write_params, sweep_name(fout, gap), params[gap])
+        if storms:
+            _timed(report, 'storms', _write_storms, sweep_name(fout, gap), acc['storms'][gap])
+    return params
+
+def make_bootstrap(fin, fout, replicates=1000, seed=BOOTSTRAP_SEED, jobs=None, cache=None, interval=None, level=0.95):
+    '''Writes the bootstrap confidence intervals of the monthly parameters of the '.par' fout
+    (see bootstrap_params) next to it (fout + '.ci.csv'), from the columns of the input fin (read
+    through the cache directory, if one is given), and returns their BootstrapTable'''
+    if interval is None:
+        interval = detect_interval(fin)
+    table = bootstrap_params(load_columns(fin, cache, interval), replicates, seed, jobs, level, interval)
+    with open(fout + '.ci.csv', 'wb') as o:
+        table.write(o)
+    return table
+
+def make_windows(fin, fout, years, step=1, station_name=None, cache=None, report=None, interval=None, catalog=None):
+    '''Writes a '.par' for every `years` long window of the climate records fin (see window_params),
+    named window_name(fout, first, last), from the columns of fin (read through the cache directory,
+    if one is given), and returns their (first year, last year, Parameters)'''
+    if interval is None:
+        interval = detect_interval(fin)
+    cols = _timed(report, 'parse', load_columns, fin, cache, interval)
+    if report is not None:
+        report.info['interval'] = interval
+        report.rows = len(cols['month'])
+    if station_name is None:
+        station_name = station_name_of(fin)
+    windows = _timed(report, 'compute', window_params, cols, years, step, station_name, interval, catalog)
+    for first, last, params in windows:
+        try:
+            _timed(report, 'write', _write_params, window_name(fout, first, last), params)
+        except ValueError as e:
+            raise ValueError('%d-%d: %s' % (first, last, e))
+    return windows
+
+
+STATE_VERSION = 3
+
+def _find_state_class(module, name):
+    #state saved from the command line refers to __main__, state saved through the library to CliPar
+    if module in ('__main__', 'CliPar'):
+        return globals()[name]
+    __import__(module)
+    return getattr(sys.modules[module], name)
+
+def load_state(path):
+    '''Returns the engine name, RowPass and station name (None if it wasn't saved) in the state
+    file path'''
+    with open(path, 'rb') as f:
+        unpickler = cPickle.Unpickler(f)
+        unpickler.find_global = _find_state_class
+        state = unpickler.load()
+    if state.get('version') != STATE_VERSION:
+        raise ValueError('%s was saved by an incompatible version (%s)' % (path, state.get('version')))
+    return state['engine'], state['pass'], state.get('station')
+
+def save_state(path, engine, rows, station=None):
+    with open(path + '.tmp', 'wb') as f:
+        cPickle.dump({'version':STATE_VERSION, 'engine':engine, 'pass':rows, 'station':station}, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(path + '.tmp', path)
+
+def _timestamp(datetime):
+    '''(year, month, day, hour, minute) from a "mm/dd/yyyy hh:mm" string, None if it can't be parsed'''
+    try:
+        parts = datetime.split()
+        (m,d,y) = parts[0].split("/")
+        (hh,mm) = parts[1].split(":") if len(parts) > 1 else (0, 0)
+        return (int(y), int(m), int(d), int(hh), int(mm))
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def _records_after(data_arr, last):
+    '''The records (csv.DictReader rows) after the one at datetime last'''
+    last = _timestamp(last)
+    data_arr = iter(data_arr)
+    if last is not None:
+        for row in data_arr:
+            t = _timestamp(row['datetime'])
+            if t is not None and t > last:
+                yield row
+                break
+    for row in data_arr:
+        yield row
+
+def update_par(fin, fout, engine='rows', station_name=None, state=None, report=None, storms=False, interval=None, catalog=None):
+    '''Writes the '.par' file fout and returns its Parameters like make_par, carrying on from the per-row pass saved in the state
+    file (default fout + '.state') by the last run, so only the records in fin that are newer than the
+    last record seen need processing. Records in fin up to that one are skipped, so fin can hold either
+    only the new records or the whole record with the new ones appended. Without a state file the pass
+    starts from scratch. The state file is rewritten before the '.par'. The station name is kept in
+    it too: without station_name, the station keeps the name of the first run (which defaults to
+    its input's name), not the name of the file with the new records.
+    
+    Works with the rows and streaming engines; with streaming the state file has a constant size.
+    The records keep the interval of the first run (by default detected from its first records). When
+    they're added up to 15 minutes, the state is saved with the last 15 minutes held back, so records
+    of the same 15 minutes in the next run's fin make one record with them.
+    A RunReport times the stages and counts the rejected records of this run. With storms (rows 
+    engine), the StormTable of the whole record is written next to the '.par' (fout + '.storms.csv').'''
+    if is_arrow_input(fin):
+        raise ValueError('Parquet and Arrow input need the columnar engine, not %s' % engine)
+    if state is None:
+        state = fout + '.state'
+    saved_name = None
+    if os.path.exists(state):
+        saved, rows, saved_name = load_state(state)
+        if saved != engine:
+            raise ValueError('%s was saved by the %s engine, not %s' % (state, saved, engine))
+        if interval not in (None, rows.interval):
+            raise ValueError('%s was saved for records %d minutes apart, not %d' % (state, rows.interval, interval))
+    else:
+        rows = RowPass(OnlineStats if engine == 'streaming' else list, interval=interval or detect_interval(fin))
+    rejected = None
+    if report is not None:
+        report.info['interval'] = rows.interval
+        rejected = report.rejected = Counter()
+    station_name = station_name or saved_name or station_name_of(fin)
+    count = rows.rowcount
+    with open_input(fin) as filereader:
+        _timed(report, 'accumulate', rows.feed, _records_after(csv.DictReader(filereader), rows.last), rejected, True)
+    #saved before writing, so the records read aren't lost if the '.par' can't be written yet
+    save_state(state, engine, rows, station_name)
+    rows.feed([], rejected) #the records held back, for this run's '.par'
+    if report is not None:
+        report.rows = rows.rowcount - count
+    
+    acc = rows.result()
+    params = _timed(report, 'compute', compute_params, acc, station_name, catalog)
+    _timed(report, 'write', _write_params, fout, params)
+    if storms:
+        _timed(report, 'storms', _write_storms, fout, acc['storms'][rows.gaps[0]])
+    return params
+
+
+CHUNK_REPLAY = 3 #days read again before a chunk starts, to pick up the day and wind state
+
+def _chunk_dry(interval):
+    '''Dry records in a row, `interval` minutes apart, that leave (the 30 minute window, the 6 hour
+    window) of the per-row pass empty: (2, 24) for 15 minute records. For records added up to
+    INTERVAL minutes the run has to hold that many whole INTERVAL minutes wherever it starts.'''
+    step = resampled(interval)
+    ratio = step//interval
+    return tuple(steps*ratio + ratio - 1 for steps in window_steps(step)[:2])
+
+def _parses(value):
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def _lines(f, end=None):
+    '''Lines of the open file f from its current position up to the byte offset end'''
+    while end is None or f.tell() < end:
+        line = f.readline()
+        if not line:
+            break
+        yield line
+
+def _scan_records(f, header):
+    '''Yields (offset, record) for the records in the open '.csv' f from its current position, with
+    each record a dict like the rows of csv.DictReader'''
+    while True:
+        offset = f.tell()
+        line = f.readline()
+        if not line:
+            break
+        fields = csv.reader([line]).next()
+        if not fields:
+            #csv.DictReader skips blank lines
+            continue
+        row = dict(zip(header, fields))
+        for key in header[len(fields):]:
+            row[key] = None
+        yield offset, row
+
+def _chunk_start(f, header, offset, interval=INTERVAL):
+    '''(replay offset, start offset) of the first place after the byte offset where the records can
+    be split, or None if there isn't one.
+
+    A chunk starts on the first record of a day with 6 hours of dry time steps before it (see
+    _chunk_dry), so the precip windows are empty and no storm can end until the next wet one (the
+    storm in progress is stitched together by merge_chunks). The CHUNK_REPLAY days before it are read
+    again to get the day so far and the last wind reading, which needs 30 dry minutes in the first
+    two of them (so the running 30 minute total is exact from then on) and a wind reading with a
+    direction.'''
+    dry30, dry6 = _chunk_dry(interval)
+    f.seek(offset)
+    f.readline()
+    steps = [] #(offset, dry, wind speed and direction read, direction read) for each time step
+    days = [] #index in steps of the first record of each day
+    lastday = None
+    dryrun = 0
+    for offset, row in _scan_records(f, header):
+        valid = not (row['datetime'] == '' or row['prcp'] == '')
+        dry = not valid or _to_float(row['prcp']) == 0
+        if valid:
+            try:
+                day = int(dateparse(row['datetime'])['d'])
+            except (TypeError, ValueError):
+                #can't split near a record the per-row pass can't read
+                steps, days, lastday, dryrun = [], [], None, 0
+                continue
+            if lastday is not None and day != lastday:
+                days.append(len(steps))
+                if len(days) > CHUNK_REPLAY + 1:
+                    cut = days[-CHUNK_REPLAY - 1]
+                    steps = steps[cut:]
+                    days = [i - cut for i in days[-CHUNK_REPLAY - 1:]]
+                if len(days) == CHUNK_REPLAY + 1 and dryrun >= dry6:
+                    replay = steps[:days[-1]]
+                    pair = any(all(step[1] for step in replay[i:i + dry30]) for i in range(days[-2] - dry30 + 1))
+                    wind = [i for i, step in enumerate(replay) if step[2]]
+                    if pair and wind and any(step[3] for step in replay[:wind[-1] + 1]):
+                        return replay[0][0], offset
+            lastday = day
+        wind = valid and all(_parses(row[c]) for c in ('temp', 'prcp', 'humid', 'srad', 'ws'))
+        steps.append((offset, dry, wind, valid and _parses(row['wdir'])))
+        dryrun = dryrun + 1 if dry else 0
+    return None
+
+def chunk_records(fin, chunks, interval=INTERVAL):
+    '''Splits the records of the '.csv' fin (`interval` minutes apart) into up to `chunks` pieces of
+    about the same size at places where the per-row pass can pick up again (see _chunk_start).
+    Returns (replay offset, start offset, end offset) for each piece; the first has no replay and the
+    last ends at None. fin can't be compressed, as the pieces are found by seeking in it.'''
+    if is_compressed(fin) or is_arrow_input(fin):
+        raise ValueError('%s isn\'t an uncompressed \'.csv\', it can\'t be split into pieces' % fin)
+    size = os.path.getsize(fin)
+    with open(fin, 'rb') as f:
+        header = csv.reader([f.readline()]).next()
+        bounds = [(None, f.tell())]
+        for k in range(1, chunks):
+            found = _chunk_start(f, header, max(size*k//chunks, bounds[-1][1]), interval)
+            if found is None:
+                break
+            bounds.append(found)
+    ends = [start for replay, start in bounds[1:]] + [None]
+    return [(replay, start, end) for (replay, start), end in zip(bounds, ends)]
+
+
+class _ChunkStorms(StormDetector):
+    '''StormDetector for a chunk of the records: the first storm to end is held back in head as
+    (time step of the peak, time steps, peak, month of the record it ended on), since it may have
+    started in an earlier chunk'''
+
+    def __init__(self, gap=STORM_GAP, interval=INTERVAL):
+        StormDetector.__init__(self, gap, interval=interval)
+        self.head = None
+
+    def add(self, p, when=None):
+        pmax = self.pmax
+        storm = StormDetector.add(self, p, when)
+        if storm and self.head is None:
+            self.head = (storm[0], storm[1] + self.gap, pmax, dateparse(when)['m'])
+            return None
+        return storm
+
+def _chunk_pass(job):
+    '''Runs the per-row pass over one chunk of the records, returning the RowPass, the head storm
+    as (time step of the peak, time steps, peak, month) or None, and the Counter of rejected records
+    and values in the chunk (None unless asked for)'''
+    fin, (replay, start, end), sample, counted, interval = job
+    rejected = Counter() if counted else None
+    rows = RowPass(sample, interval=interval)
+    with open(fin, 'rb') as f:
+        header = csv.reader([f.readline()]).next()
+        if replay is not None:
+            f.seek(replay)
+            rows.feed(csv.DictReader(_lines(f, start), header))
+            rows.restart()
+        f.seek(start)
+        rows.detectors[0] = _ChunkStorms(rows.gaps[0], rows.step)
+        rows.feed(csv.DictReader(_lines(f, end), header), rejected)
+    return rows, rows.detectors[0].head, rejected
+
+def _prepend(value, values):
+    first = OnlineStats() if isinstance(values, OnlineStats) else []
+    first.append(value)
+    return _concat(first, values)
+
+def merge_chunks(parts, rejected=None):
+    '''Reduces the (RowPass, head storm) of consecutive chunks from _chunk_pass into the values
+    accumulate_rows() gives for all of the records. The monthly values are joined in order, and the
+    first storm of each chunk is put back together with the storm in progress at its start (counted
+    in rejected, if given, when it's a one step storm).'''
+    acc = None
+    carry = (0, 0, 0) #time steps, time step of the peak and peak of the storm in progress
+    for rows, head in parts:
+        part = rows.result()
+        part['ttp'] = dict(part['ttp'])
+        storms = rows.detectors[0]
+        t, tmax, pmax = carry
+        if head:
+            peak, steps, peakp, m = head
+            if peakp > pmax:
+                tmax = t + peak
+            try:
+                part['ttp'][m] = _prepend(float(tmax)/(t + steps - storms.gap), part['ttp'][m])
+            except ZeroDivisionError:
+                #Storm event lasted a time step of 0; only one 15 min precip event recorded
+                if rejected is not None:
+                    rejected['one step storm'] += 1
+            carry = (storms.t, storms.tmax, storms.pmax)
+        else:
+            carry = (t + storms.t, t + storms.tmax if storms.pmax > pmax else tmax, max(pmax, storms.pmax))
+
+        if acc is None:
+            acc = part
+            continue
+        acc['rows'] += part['rows']
+        acc['daycount'] += part['daycount']
+        acc['prcp30_record'] = max(acc['prcp30_record'], part['prcp30_record'])
+        acc['prcp6_record'] = max(acc['prcp6_record'], part['prcp6_record'])
+        for key in ('ww', 'wd', 'dd', 'ttp', 'dew', 'srad', 'tempmax', 'tempmin', 'prcp30_max'):
+            acc[key] = dict((m, _concat(acc[key][m], part[key][m])) for m in acc[key])
+        acc['calm'] = dict((m, [a + b for a, b in zip(acc['calm'][m], part['calm'][m])]) for m in acc['calm'])
+        acc['wind'].merge(part['wind'])
+    #the storm tables of the chunks aren't stitched together, only the time to peak
+    acc['storms'] = None
+    return acc
+
+def accumulate_parallel(fin, jobs=None, sample=list, rejected=None, interval=INTERVAL):
+    '''Returns the same values as accumulate_rows() for the '.csv' fin of records `interval` minutes
+    apart, splitting the records into chunks (see chunk_records) that are run by a pool of `jobs`
+    worker processes (one per cpu by default) and merged (see merge_chunks)'''
+    jobs = jobs or multiprocessing.cpu_count()
+    chunks = chunk_records(fin, jobs, interval)
+    pool = multiprocessing.Pool(min(jobs, len(chunks)), _batch_init)
+    try:
+        parts = pool.map(_chunk_pass, [(fin, chunk, sample, rejected is not None, interval) for chunk in chunks])
+        pool.close()
+    except:
+        #a chunk that raised (eg. on a value that isn't a number) can leave the pool unable to close
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    if rejected is not None:
+        for rows, head, counts in parts:
+            rejected.update(counts)
+    return merge_chunks([(rows, head) for rows, head, counts in parts], rejected)
+
+
+MANIFEST_FIELDS =('station', 'input', 'output', 'status', 'rows', 'years', 'seconds', 'error')
+
+_batch_catalog = None #the StationCatalog of a batch, in each worker process
+
+def _batch_init(catalog=None):
+    global _batch_catalog
+    #treat numpy errors as real errors
+    np.seterr(all='raise')
+    _batch_catalog = catalog
+
+def _batch_station(job):
+    '''Runs one station of a batch, returning its manifest record; errors are recorded, not raised'''
+    fin, fout, engine, cache, update, profile = job
+    record = dict.fromkeys(MANIFEST_FIELDS, '')
+    record.update(station=station_name_of(fin), input=fin, output=fout)
+    report = new_report(fin, fout, engine) if profile else None
+    start = time.time()
+    try:
+        if update:
+            params = update_par(fin, fout, engine, report=report, catalog=_batch_catalog)
+        else:
+            params = make_par(fin, fout, engine, cache=cache, report=report, catalog=_batch_catalog)
+        record.update(status='ok', rows=params.rows, years=int(params.years))
+    except Exception as e:
+        record.update(status='failed', error='%s: %s' % (type(e).__name__, e))
+        #don't leave a partly written '.par' behind
+        if os.path.exists(fout):
+            os.remove(fout)
+    if report is not None:
+        report.save(fout + '.json')
+    record['seconds'] = '%.3f' % (time.time() - start)
+    return record
+
+BATCH_INPUTS = ('*.csv', '*.csv.gz', '*.csv.bz2') + tuple('*' + ext for ext in ARROW_INPUTS)
+
+def batch_inputs(pattern):
+    '''Station input files in a directory (see BATCH_INPUTS), or matching a glob pattern'''
+    if os.path.isdir(pattern):
+        return sorted(f for p in BATCH_INPUTS for f in glob.glob(os.path.join(pattern, p)))
+    return sorted(glob.glob(pattern))
+
+def run_batch(pattern, outdir=None, manifest=None, workers=None, engine='rows', cache=None, update=False, profile=False, catalog=None):
+    '''Writes a '.par' for each station input in a directory or glob pattern, spread over a pool 
+    of worker processes (one per cpu by default).
+    
+    Each '.par' is written to outdir (default: next to its input), along with a RunReport ('.par.json')
+    with profile. A station that fails is recorded in the manifest ('.csv', default outdir/manifest.csv)
+    and the rest carry on. Returns the manifest records in input order. A StationCatalog is sent to
+    each worker process once, for the header and interpolated sections of every station.'''
+    inputs = batch_inputs(pattern)
+    if outdir and not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    jobs = []
+    for fin in inputs:
+        fout = input_root(fin) + '.par'
+        if outdir:
+            fout = os.path.join(outdir, os.path.basename(fout))
+        jobs.append((fin, fout, engine, cache, update, profile))
+    if manifest is None:
+        manifest = os.path.join(outdir or '.', 'manifest.csv')
+    
+    pool = multiprocessing.Pool(workers, _batch_init, (catalog,))
+    records = {}
+    try:
+        with open(manifest, 'wb') as m:
+            writer = csv.DictWriter(m, MANIFEST_FIELDS)
+            writer.writeheader()
+            for record in pool.imap_unordered(_batch_station, jobs):
+                records[record['input']] = record
+                writer.writerow(record)
+                m.flush()
+                print "{0: <12} {1: <6} {2}".format(record['station'], record['status'], record['error'])
+    finally:
+        pool.close()
+        pool.join()
+    return [records[fin] for fin in inputs]
+
+
+def main(argv=None):
+    '''Command line: writes a '.par' for one station (asking for the file names if they aren't
+    given), or for a batch of stations'''
+    
+    #treat numpy errors as real errors
+    np.seterr(all='raise')
+    
+   #Create argument parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', help='Input climate data file name (\'*.csv\', \'*.csv.gz\' or \'*.csv.bz2\', or \'*.parquet\' or \'*.arrow\' with the columnar engine)')
+    parser.add_argument('-o', '--output', help='Output parameter file name (\'*.par\')')
+    parser.add_argument('-e', '--engine', choices=ENGINES, default='rows', help='Processing engine (default: rows)')
+    parser.add_argument('-b', '--batch', help='Directory or glob of station climate data files (\'*.csv\' and the other inputs) to run as a batch')
+    parser.add_argument('-d', '--outdir', help='Batch output directory for the \'*.par\' files (default: next to the inputs)')
+    parser.add_argument('-m', '--manifest', help='Batch manifest file name (default: OUTDIR/manifest.csv)')
+    parser.add_argument('-w', '--workers', type=int, help='Number of batch or bootstrap worker processes (default: one per cpu)')
+    parser.add_argument('-c', '--cache', help='Directory to cache the parsed input columns in (columnar engine)')
+    parser.add_argument('-j', '--jobs', type=int, help='Split a single input over this many worker processes (rows and streaming engines)')
+    parser.add_argument('-u', '--update', action='store_true', help='Carry on from the state saved next to the \'*.par\' (\'*.par.state\') by the last run, processing only newer records')
+    parser.add_argument('-t', '--interval', type=int, help='Minutes between the input records; 1, 3 and 5 are added up to 15 minutes (default: the most common among the first records)')
+    parser.add_argument('-g', '--gaps', type=int, nargs='+', help='Dry time steps between storms to sweep: writes a \'*.par\' for each (OUTPUT_g<gap>.par) from one pass (default: an hour, %d steps of 15 minutes, for OUTPUT)' % STORM_GAP)
+    parser.add_argument('-s', '--storms', action='store_true', help='Write the storm event table next to each \'*.par\' (\'*.par.storms.csv\'; rows and columnar engines)')
+    parser.add_argument('-C', '--catalog', help='Station catalog file name (\'*.csv\') for the \'*.par\' header and interpolated sections')
+    parser.add_argument('-B', '--bootstrap', type=int, metavar='REPLICATES', help='Write bootstrap confidence intervals of the monthly parameters next to the \'*.par\' (\'*.par.ci.csv\') from this many replicates (worked out from the columnar series; rows or columnar engine)')
+    parser.add_argument('-W', '--windows', type=int, metavar='YEARS', help='Write a \'*.par\' for every window of this many years of the record (OUTPUT_<first>-<last>.par) instead of the whole record (columnar engine)')
+    parser.add_argument('-p', '--profile', action='store_true', help='Write a report of the stage timings and rejected records next to the \'*.par\' (\'*.par.json\')')
+    args = parser.parse_args(argv)
+    if args.cache and args.engine != 'columnar':
+        parser.error('--cache needs the columnar engine (-e columnar)')
+    if args.update and args.engine == 'columnar':
+        parser.error('--update needs the rows or streaming engine')
+    if args.jobs and (args.engine == 'columnar' or args.batch or args.update):
+        parser.error('--jobs needs the rows or streaming engine, and a single input without --update')
+    if (args.gaps or args.storms) and (args.batch or args.jobs):
+        parser.error('--gaps and --storms need a single input without --jobs')
+    if args.gaps and args.update:
+        parser.error('--gaps can\'t be used with --update')
+    if args.storms and args.engine == 'streaming':
+        parser.error('--storms needs the rows or columnar engine, streaming doesn\'t keep the storms')
+    if args.gaps and [g for g in args.gaps if g < 1]:
+        parser.error('--gaps must be at least 1 time step')
+    if args.interval is not None and not 1 <= args.interval <= 60:
+        parser.error('--interval must be from 1 to 60 minutes')
+    if args.interval and args.batch:
+        parser.error('--interval can\'t be used with --batch, each station\'s is detected')
+    if args.bootstrap is not None and args.engine == 'streaming':
+        parser.error('--bootstrap needs the rows or columnar engine, its intervals come from the exact columnar series')
+    if args.bootstrap is not None and (args.batch or args.update or args.bootstrap < 1):
+        parser.error('--bootstrap needs at least 1 replicate and a single input without --update')
+    if args.windows is not None and args.engine != 'columnar':
+        parser.error('--windows needs the columnar engine (-e columnar)')
+    if args.windows is not None and (args.batch or args.update or args.gaps or args.storms or args.windows < 1):
+        parser.error('--windows needs at least 1 year and a single input without --update, --gaps or --storms')
+    
+    catalog = load_catalog(args.catalog) if args.catalog else None
+    if args.batch:
+        records = run_batch(args.batch, args.outdir, args.manifest, args.workers, args.engine, args.cache, args.update, args.profile, catalog)
+        failed = len([r for r in records if r['status'] != 'ok'])
+        print "{0} stations, {1} failed".format(len(records), failed)
+        raise SystemExit(1 if failed else 0)
+    
+    #handel arguments
+    if args.input:
+        fin = args.input
+    else:
+        fin = raw_input('Input climate data file name (\'*.csv\'): ')
         
-        
\ No newline at end of file
+    if '.csv' not in fin and not is_arrow_input(fin):
+        print "Using test input file"
+        fin = "test.csv"
+    if is_arrow_input(fin) and args.engine != 'columnar':
+        parser.error('Parquet and Arrow input need the columnar engine (-e columnar)')
+    if args.jobs and is_compressed(fin):
+        parser.error('--jobs needs an uncompressed \'*.csv\'')
+    
+    if args.output:
+        fout = args.output
+    else:
+        fout = raw_input('Output parameter file name (\'*.par\'): ')
+    if '.par' not in fout:
+        print "Using test output file"    
+        fout = "test.par"
+        
+
+    report = new_report(fin, fout, args.engine) if args.profile else None
+    try:
+        if args.update:
+            update_par(fin, fout, args.engine, report=report, storms=args.storms, interval=args.interval, catalog=catalog)
+        elif args.windows:
+            make_windows(fin, fout, args.windows, 1, station_name_of(fin), args.cache, report, args.interval, catalog)
+        elif args.gaps:
+            make_sweep(fin, fout, args.gaps, args.engine, station_name_of(fin), args.cache, report, args.storms, args.interval, catalog)
+        else:
+            make_par(fin, fout, args.engine, station_name_of(fin), args.cache, args.jobs, report, args.storms, args.interval, catalog)
+        if args.bootstrap:
+            _timed(report, 'bootstrap', make_bootstrap, fin, fout, args.bootstrap, BOOTSTRAP_SEED, args.workers, args.cache, args.interval)
+    finally:
+        if report is not None:
+            report.save(fout + '.json')
+
+
+if __name__ == "__main__":
+    main()
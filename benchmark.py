@@ -0,0 +1,266 @@
+import argparse, csv, json, os, platform, subprocess, sys, time
+import multiprocessing
+from array import array
+
+import numpy as np
+
+import CliPar
+import synthetic
+
+'''
+Benchmarks CliPar stage by stage on synthetic climate records (see synthetic.py), so performance
+can be compared from one version to the next.
+
+For each engine and length of record it reports the wall time, rows per second and memory of
+each stage:
+parse       reading the '.csv' (columnar: into typed arrays; rows and streaming: csv.DictReader)
+daily       daily aggregation (columnar: days, daily precip, temps, solar radiation and wind)
+row pass    rows and streaming only: the per-row pass, which parses the rows, aggregates days and
+            detects storms in the same loop
+storms      storm detection (rows and streaming: the StormDetector alone, over the precip column,
+            which the row pass also does)
+monthly     compute_params, the monthly statistics
+write       writing the '.par'
+
+The total of a run is the time of the stages a '.par' goes through (for rows and streaming: the
+row pass, monthly and write).
+
+Each run is done in a fresh worker process, so the memory of one doesn't carry over to the next.
+The peak RSS of a stage is the high water mark of the process during it (KB), and its added RSS how
+far that rose over the resident memory at its start, the memory the stage itself took. The high
+water mark is reset before each stage (through /proc/self/clear_refs, linux only); where it can't
+be, the peak is the process's so far and the added RSS isn't known. With repeats, the fastest time
+and the largest memory of each stage are kept.
+
+The synthetic inputs are kept in the data directory and reused. The results are saved as JSON
+along with the python and numpy versions and the git commit, and a previous results file can be
+given to print the speedup of each stage against it.
+
+Usage:
+python benchmark.py -y 1 10 100 -e rows columnar -o results.json -c last_release.json
+'''
+
+
+RESULTS_VERSION = 2
+STAGES = ('parse', 'daily', 'row pass', 'storms', 'monthly', 'write')
+
+
+def _status_kb(field):
+    #a memory field of /proc/self/status (KB), None where there's none
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+def reset_peak_rss():
+    '''Resets the high water mark of this process's resident memory to the resident memory now,
+    returning that (KB), or None where it can't be reset'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        return None
+    return _status_kb('VmRSS')
+
+def peak_rss():
+    '''High water mark of this process's resident memory (KB), since the last reset_peak_rss where
+    it could be reset, None where it isn't known'''
+    peak = _status_kb('VmHWM')
+    if peak is not None:
+        return peak
+    try:
+        import resource #unix only
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak//1024 if sys.platform == 'darwin' else peak #bytes on mac os
+
+
+class _Stages(object):
+    #times each stage in turn
+    def __init__(self, rows):
+        self.rows = rows
+        self.records = []
+
+    def run(self, stage, f, *args):
+        rss = reset_peak_rss()
+        start = time.time()
+        result = f(*args)
+        seconds = time.time() - start
+        peak = peak_rss()
+        self.records.append({'stage':stage, 'seconds':seconds, 'peak_rss_kb':peak,
+                             'added_rss_kb':peak - rss if peak is not None and rss is not None else None,
+                             'rows_per_sec':self.rows/seconds if seconds else None})
+        return result
+
+
+def _read_rows(fin):
+    #the csv.DictReader pass on its own, keeping only the precip for the storm stage
+    prcp = array('d')
+    with open(fin, 'rb') as f:
+        for row in csv.DictReader(f):
+            try:
+                prcp.append(float(row['prcp'])/25.4 if row['datetime'] else np.nan)
+            except ValueError:
+                prcp.append(np.nan)
+    return prcp
+
+def _row_pass(fin, sample):
+    rows = CliPar.RowPass(sample)
+    with open(fin, 'rb') as f:
+        rows.feed(csv.DictReader(f))
+    return rows.result()
+
+def _detect_storms(prcp):
+    storms = CliPar.StormDetector()
+    found = 0
+    for p in prcp:
+        if p != p:
+            storms.skip()
+        elif storms.add(p):
+            found += 1
+    return found
+
+def _read_columns(fin):
+    with open(fin, 'rb') as f:
+        return CliPar.read_columns(f)
+
+def _daily_columns(cols):
+    with np.errstate(all='ignore'):
+        rec = CliPar._record_columns(cols)
+        return rec, CliPar._daily_columns(rec)
+
+def _storm_columns(rec):
+    with np.errstate(all='ignore'):
+        return CliPar._storm_columns(rec)
+
+def _write(fout, params):
+    with open(fout, 'w') as o:
+        o.write(CliPar.par_text(params))
+
+def run_stages(fin, engine, rows):
+    '''Runs the stages of CliPar over the input fin ('.csv' of `rows` records) with engine, returning
+    a record for each stage'''
+    stages = _Stages(rows)
+    if engine == 'columnar':
+        cols = stages.run('parse', _read_columns, fin)
+        rec, acc = stages.run('daily', _daily_columns, cols)
+        acc['ttp'] = stages.run('storms', _storm_columns, rec).ttp
+    else:
+        prcp = stages.run('parse', _read_rows, fin)
+        acc = stages.run('row pass', _row_pass, fin, CliPar.OnlineStats if engine == 'streaming' else list)
+        stages.run('storms', _detect_storms, prcp)
+    params = stages.run('monthly', CliPar.compute_params, acc, 'BENCHMARK')
+    stages.run('write', _write, os.path.splitext(fin)[0] + '.' + engine + '.par', params)
+    return stages.records
+
+def _run(job):
+    fin, engine, rows = job
+    return run_stages(fin, engine, rows)
+
+def synthetic_input(datadir, years, seed):
+    '''The synthetic '.csv' for years and seed in datadir (written if it isn't there yet), and its
+    number of records'''
+    fin = os.path.join(datadir, 'synthetic_%dy_%d.csv' % (years, seed))
+    if not os.path.exists(fin):
+        if not os.path.isdir(datadir):
+            os.makedirs(datadir)
+        synthetic.generate(fin + '.tmp', years, seed)
+        os.rename(fin + '.tmp', fin)
+    with open(fin, 'rb') as f:
+        rows = sum(1 for line in f) - 1
+    return fin, rows
+
+def benchmark(years=(1, 10), engines=CliPar.ENGINES, repeat=1, seed=0, datadir='benchmark_data'):
+    '''Benchmarks each engine on synthetic records of each number of years, returning a record for
+    each run: engine, years, rows, input size and the stages'''
+    runs = []
+    for y in years:
+        fin, rows = synthetic_input(datadir, y, seed)
+        for engine in engines:
+            best = {}
+            for i in range(repeat):
+                pool = multiprocessing.Pool(1)
+                try:
+                    stages = pool.apply(_run, ((fin, engine, rows),))
+                finally:
+                    pool.close()
+                    pool.join()
+                for s in stages:
+                    b = best.setdefault(s['stage'], s)
+                    b['peak_rss_kb'] = max(b['peak_rss_kb'], s['peak_rss_kb'])
+                    b['added_rss_kb'] = max(b['added_rss_kb'], s['added_rss_kb'])
+                    if s['seconds'] < b['seconds']:
+                        b['seconds'], b['rows_per_sec'] = s['seconds'], s['rows_per_sec']
+            stages = [best[s] for s in STAGES if s in best]
+            #the row pass of the rows and streaming engines does their parsing and storm detection
+            seconds = sum(s['seconds'] for s in stages if not ('row pass' in best and s['stage'] in ('parse', 'storms')))
+            run = {'engine':engine, 'years':y, 'seed':seed, 'rows':rows, 'input_bytes':os.path.getsize(fin),
+                   'seconds':seconds, 'rows_per_sec':rows/seconds if seconds else None, 'stages':stages}
+            runs.append(run)
+            _print_run(run)
+    return runs
+
+def _print_run(run):
+    print "{0: <10} {1: >4} years {2: >9} rows {3: >9.2f} s {4: >10.0f} rows/s".format(run['engine'], run['years'], run['rows'], run['seconds'], run['rows_per_sec'] or 0)
+    for s in run['stages']:
+        print "    {0: <10} {1: >9.3f} s {2: >12.0f} rows/s {3: >9} KB peak {4: >9} KB added".format(s['stage'], s['seconds'], s['rows_per_sec'] or 0, s['peak_rss_kb'], s['added_rss_kb'])
+
+def _git_commit():
+    try:
+        with open(os.devnull, 'w') as null:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=null).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(fout, runs, label=None):
+    results = {'version':RESULTS_VERSION, 'label':label, 'commit':_git_commit(),
+               'created':time.strftime('%Y-%m-%dT%H:%M:%S'), 'python':platform.python_version(),
+               'numpy':np.__version__, 'platform':platform.platform(), 'runs':runs}
+    with open(fout, 'w') as o:
+        json.dump(results, o, indent=1, sort_keys=True)
+
+def compare(runs, fold):
+    '''Prints the speedup of each stage against the results saved in fold (>1 is faster now)'''
+    with open(fold) as f:
+        old = json.load(f)
+    before = {}
+    for run in old['runs']:
+        for s in run['stages']:
+            before[(run['engine'], run['years'], s['stage'])] = s['seconds']
+        before[(run['engine'], run['years'], 'total')] = run['seconds']
+    print "Speedup against {0} ({1})".format(fold, old.get('label') or old.get('commit'))
+    for run in runs:
+        for stage, seconds in [(s['stage'], s['seconds']) for s in run['stages']] + [('total', run['seconds'])]:
+            then = before.get((run['engine'], run['years'], stage))
+            if then is not None and seconds:
+                print "{0: <10} {1: >4} years {2: <10} {3: >6.2f}x".format(run['engine'], run['years'], stage, then/seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks CliPar stage by stage on synthetic climate records')
+    parser.add_argument('-y', '--years', type=int, nargs='+', default=[1, 10], help='Years of record to run (default: 1 10)')
+    parser.add_argument('-e', '--engine', nargs='+', choices=CliPar.ENGINES, default=list(CliPar.ENGINES), help='Engines to run (default: all)')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='Runs of each, keeping the fastest (default: 1)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Random seed of the synthetic records (default: 0)')
+    parser.add_argument('-d', '--data', default='benchmark_data', help='Directory for the synthetic inputs (default: benchmark_data)')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='Results file name (default: benchmark.json)')
+    parser.add_argument('-l', '--label', help='Label saved with the results, eg. the version')
+    parser.add_argument('-c', '--compare', help='Previous results file to compare against')
+    args = parser.parse_args(argv)
+    if [y for y in args.years if not 1 <= y <= 100]:
+        parser.error('--years must be from 1 to 100')
+
+    runs = benchmark(args.years, args.engine, args.repeat, args.seed, args.data)
+    save_results(args.output, runs, args.label)
+    print "Results written to {0}".format(args.output)
+    if args.compare:
+        compare(runs, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+import argparse, json, os, re, subprocess, sys, time
+from cStringIO import StringIO
+
+import numpy as np
+
+import CliPar
+import synthetic
+
+'''
+Checks that every engine of CliPar, with each combination of the input cache (-c) and worker
+processes (-j), writes the same '.par' as the original single loop of CliPar did (the baseline
+commit), on a corpus of synthetic and edge case records, and how much faster each is.
+
+The '.par' files of the original loop are kept in the golden directory (see GOLDEN), one for each
+input of the default corpus: <input>.par, or <input>.err with the error the loop stopped with. With
+-g they're written again for the corpus by running a CliPar.py of the original loop, eg.
+git show e129164:CliPar.py > baseline.py; python equivalence.py -g baseline.py
+Inputs without a golden '.par' are skipped. The inputs are generated from fixed seeds, so they're
+the same each time (as long as synthetic.py and numpy's RandomState don't change).
+
+Variants: rows, columnar and streaming, each alone and with -c, -j and -c -j (the flags an engine
+doesn't use should leave its '.par' as it is). Each writes its '.par' through make_par, the same way
+the command line does.
+
+Corpus:
+synthetic_<years>y_<seed>   records from synthetic.py, for each number of years and seed
+edge_<case>_<seed>          two years of synthetic records, changed to have
+    gaps                logger gaps of a few days across month ends, hours out of storms and
+                        single missing steps
+    blank_prcp          blank precip, at random, in storms and for a whole day
+    single_step_storms  single tips on otherwise dry days
+    month_boundaries    storms across every month (and year) end, and a record starting and ending
+                        in the middle of a month
+    zero_humidity       humidity of 0 (no dew point), at random and for a whole week
+failing_<case>_<seed>       a year of synthetic records no '.par' can be made from, with
+    unparseable_prcp    precip that isn't a number in a few rows
+
+The header and interpolated data of a variant's '.par' must be the same as the golden one, and each
+value (YEARS, TP5, TP6, the monthly parameters and the wind blocks) within the engine's tolerance
+(see TOLERANCES), in units of the last place written: the rows and columnar engines must write the
+same values, streaming may be a unit off for rounding, and its skews a further 3*0.005*|median|/std
+for its medians (within 0.5%, see QuantileSketch). Each run is one of:
+same        the same '.par' as the golden one (or the same error)
+within      a different '.par', but every value within the tolerance
+DIFF        the header or a value that isn't
+FAIL        an error where the golden '.par' has none, or none (or another) where it has one
+
+On the failing inputs, each engine must stop with the same error with worker processes as without.
+
+With -o the results are saved as JSON. Exits with status 1 if any run is DIFF or FAIL.
+
+Usage:
+python equivalence.py -y 1 3 -s 0 -e rows columnar streaming -o equivalence.json
+'''
+
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+EDGE_CASES = ('gaps', 'blank_prcp', 'single_step_storms', 'month_boundaries', 'zero_humidity')
+EDGE_YEARS = 2
+FAILING_CASES = ('unparseable_prcp',)
+HUMID = 2 #columns of a row of the '.csv'
+PRCP = 5
+
+ENGINES = ('rows', 'columnar', 'streaming')
+#engine: (units of the last place written a value can be off by, relative error of a median)
+EXACT = (0, 0.0)
+SKETCH = (1, 0.005)
+TOLERANCES = {'rows':EXACT, 'columnar':EXACT, 'streaming':SKETCH}
+TINY = 1e-6 #values closer to 0 than this count as 0 in a streaming median
+HEADER_VALUES = re.compile(r'(YEARS=|TP5 =|TP6 =)\s*([-0-9.]+)')
+
+
+def _base(years, seed):
+    #header and rows (lists of fields) of a synthetic record
+    out = StringIO()
+    synthetic.generate(out, years, seed)
+    lines = out.getvalue().splitlines()
+    return lines[0], [line.split(',') for line in lines[1:]]
+
+def _floats(rows, column):
+    return np.array([float(row[column]) if row[column] else np.nan for row in rows])
+
+def _month_ends(rows):
+    #index of the last row of each month
+    months = np.array([int(row[0].split('/', 1)[0]) for row in rows])
+    return np.flatnonzero(months[1:] != months[:-1])
+
+def _on(rows, dates):
+    #indexes of the rows on the dates (m/d/yyyy)
+    return np.array([i for i, row in enumerate(rows) if row[0].split(' ')[0] in dates], dtype=int)
+
+def _gaps(rows, rng):
+    keep = np.ones(len(rows), dtype=bool)
+    for end in _month_ends(rows)[::3]:
+        keep[max(0, end - 2*synthetic.STEPS):end + synthetic.STEPS] = False #two days before to a day after
+    wet = np.flatnonzero(np.nan_to_num(_floats(rows, PRCP)) > 0)
+    for start in rng.choice(wet, min(20, len(wet)), replace=False):
+        keep[start:start + rng.randint(2, 25)] = False #half an hour to six hours
+    keep[rng.random_sample(len(rows)) < 0.005] = False
+    return [row for row, k in zip(rows, keep) if k]
+
+def _blank_prcp(rows, rng):
+    blank = rng.random_sample(len(rows)) < 0.01
+    blank[np.flatnonzero(np.nan_to_num(_floats(rows, PRCP)) > 0)[::25]] = True
+    blank[_on(rows, ('6/10/2000',))] = True
+    for i in np.flatnonzero(blank):
+        rows[i][PRCP] = ''
+    return rows
+
+def _single_step_storms(rows, rng):
+    #tips at least two hours from any other precip
+    wet = np.nan_to_num(_floats(rows, PRCP)) != 0
+    dry = np.flatnonzero(np.convolve(wet, np.ones(17), 'same') == 0)
+    for i in rng.choice(dry, min(300, len(dry)), replace=False):
+        rows[i][PRCP] = '%.3f' % synthetic.TIP
+    return rows
+
+def _month_boundaries(rows, rng):
+    for end in _month_ends(rows):
+        for i in range(max(0, end - 3), min(len(rows), end + 5)):
+            rows[i][PRCP] = '%.3f' % (synthetic.TIP*rng.randint(1, 4))
+    return rows[14*synthetic.STEPS:-16*synthetic.STEPS]
+
+def _zero_humidity(rows, rng):
+    zero = rng.random_sample(len(rows)) < 0.01
+    zero[_on(rows, ['7/%d/2000' % d for d in range(1, 8)])] = True
+    for i in np.flatnonzero(zero):
+        rows[i][HUMID] = '0'
+    return rows
+
+def _unparseable_prcp(rows, rng):
+    for i in rng.choice(len(rows), 3, replace=False):
+        rows[i][PRCP] = 'x'
+    return rows
+
+def edge_case(fout, case, seed=0):
+    '''Writes the edge case record (see EDGE_CASES and FAILING_CASES) for seed to the '.csv' fout'''
+    header, rows = _base(1 if case in FAILING_CASES else EDGE_YEARS, seed)
+    rng = np.random.RandomState(seed + 1 + (EDGE_CASES + FAILING_CASES).index(case))
+    rows = globals()['_' + case](rows, rng)
+    with open(fout, 'wb') as o:
+        o.write(header + '\n')
+        o.writelines(','.join(row) + '\n' for row in rows)
+
+def corpus(datadir, years=(1, 3), seeds=(0,), cases=EDGE_CASES):
+    '''The '.csv' inputs of the corpus in datadir (written if they aren't there yet), as
+    (name, file name)'''
+    inputs = []
+    for seed in seeds:
+        for y in years:
+            inputs.append(('synthetic_%dy_%d' % (y, seed), lambda fout, y=y, seed=seed: synthetic.generate(fout, y, seed)))
+        for case in cases:
+            inputs.append(('edge_%s_%d' % (case, seed), lambda fout, case=case, seed=seed: edge_case(fout, case, seed)))
+    return _written(datadir, inputs)
+
+def failing_corpus(datadir, seeds=(0,), cases=FAILING_CASES):
+    '''The failing '.csv' inputs in datadir (written if they aren't there yet), as (name, file name)'''
+    return _written(datadir, [('failing_%s_%d' % (case, seed), lambda fout, case=case, seed=seed: edge_case(fout, case, seed))
+                              for seed in seeds for case in cases])
+
+def _written(datadir, inputs):
+    if not os.path.isdir(datadir):
+        os.makedirs(datadir)
+    found = []
+    for name, write in inputs:
+        fin = os.path.join(datadir, name + '.csv')
+        if not os.path.exists(fin):
+            write(fin + '.tmp')
+            os.rename(fin + '.tmp', fin)
+        found.append((name, fin))
+    return found
+
+
+def variants(engines=ENGINES):
+    '''Each engine with each combination of the flags, as (name, engine, cached, parallel)'''
+    return [(engine + ' -c'*cached + ' -j'*parallel, engine, cached, parallel)
+            for engine in engines for cached in (False, True) for parallel in (False, True)]
+
+
+class Outcome(object):
+    '''A run over an input: the text of the '.par' it wrote, or the error it stopped with, and its
+    wall time'''
+
+    def __init__(self, text=None, error=None, seconds=None):
+        self.text = text
+        self.error = error
+        self.seconds = seconds
+
+
+def run(fin, fout, engine='rows', cache=None, jobs=None):
+    '''Outcome of make_par over fin, writing fout, for the station named like the original loop
+    names it (its input file name)'''
+    station = os.path.basename(fin).split('.')[0].upper()
+    stdout, sys.stdout = sys.stdout, StringIO() #not the short record warnings
+    start = time.time()
+    try:
+        CliPar.make_par(fin, fout, engine, station, cache, jobs)
+    except Exception as e:
+        return Outcome(error='%s: %s' % (type(e).__name__, e), seconds=time.time() - start)
+    finally:
+        sys.stdout = stdout
+    seconds = time.time() - start
+    with open(fout) as f:
+        return Outcome(f.read(), seconds=seconds)
+
+def golden(name, goldendir=GOLDEN):
+    '''The Outcome of the original loop over the input name, None if there's no golden '.par'''
+    path = os.path.join(goldendir, name)
+    if os.path.exists(path + '.par'):
+        with open(path + '.par') as f:
+            return Outcome(f.read())
+    if os.path.exists(path + '.err'):
+        with open(path + '.err') as f:
+            return Outcome(error=f.read().strip())
+    return None
+
+def write_goldens(inputs, baseline, goldendir=GOLDEN):
+    '''Writes the golden '.par' (or '.err') of each input by running the CliPar.py baseline (the
+    original loop) on it, the way it was run: from the input's directory, with the output file name
+    asked for'''
+    if not os.path.isdir(goldendir):
+        os.makedirs(goldendir)
+    baseline = os.path.abspath(baseline)
+    for name, fin in inputs:
+        path = os.path.join(os.path.abspath(goldendir), name)
+        for ext in ('.par', '.err'):
+            if os.path.exists(path + ext):
+                os.remove(path + ext)
+        p = subprocess.Popen([sys.executable, baseline, '-i', os.path.basename(fin)], cwd=os.path.dirname(os.path.abspath(fin)),
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate(path + '.par\n')
+        if p.returncode:
+            #the loop opens its output first, so it leaves a partial one behind
+            if os.path.exists(path + '.par'):
+                os.remove(path + '.par')
+            with open(path + '.err', 'w') as o:
+                o.write(err.strip().splitlines()[-1] + '\n')
+        print "{0: <32} {1}".format(name, 'error' if p.returncode else 'ok')
+
+def read_par(text):
+    '''The parts of the '.par' text: its header and interpolated data (as text, without the values of
+    YEARS, TP5 and TP6), and its values as {field: (value, unit of the last place written)}. The
+    monthly values are keyed like 'SKEW P 1' and the wind blocks like 'NNE PCT 1' or 'NNE SKEW 1'.'''
+    lines = text.split('\n')
+    header = '\n'.join(lines[:3])
+    values = dict((field.rstrip(' ='), (float(token), _unit([token]))) for field, token in HEADER_VALUES.findall(header))
+    header = HEADER_VALUES.sub(r'\1?', header)
+    body = lines[3:lines.index('', 3)]
+    direction = None
+    for line in body:
+        label, tokens = line[:8].strip(), line[8:].split()
+        if label.startswith('% '):
+            direction, label = label[2:].strip(), 'PCT'
+        if direction is not None and label in ('PCT', 'MEAN', 'STD DEV', 'SKEW'):
+            label = '%s %s' % (direction, label)
+        unit = _unit(tokens)
+        for m, token in enumerate(tokens):
+            values['%s %d' % (label, m + 1)] = (float(token), unit)
+    return header, '\n'.join(lines[3 + len(body):]), values
+
+def _unit(tokens):
+    #a unit of the last place of the most precise of the values written
+    return 10.0**-max(len(t.split('.')[1]) if '.' in t else 0 for t in tokens)
+
+def _allowed(values, field, tolerance):
+    #how far a value can be from the golden one (values) with the tolerance
+    units, median_error = tolerance
+    value, unit = values[field]
+    allowed = units*unit
+    if median_error and 'SKEW' in field:
+        #skew = 3*(mean - median)/std, with the median off by up to median_error of it
+        label, m = field.rsplit(' ', 1)
+        if label == 'SKEW P':
+            mean, std = values['MEAN P ' + m][0], values['S DEV P ' + m][0]
+        else:
+            key = label.split(' ')[0]
+            mean, std = values['%s MEAN %s' % (key, m)][0], values['%s STD DEV %s' % (key, m)][0]
+        if std > 0:
+            median = mean - value*std/3
+            allowed += 3*(median_error*abs(median) + TINY)/std
+    return allowed
+
+def compare(reference, outcome, tolerance):
+    '''(status, worst field, its deviation as a share of what's allowed) of an Outcome against the
+    golden one (see the module docstring)'''
+    if reference.error is not None or outcome.error is not None:
+        if reference.error == outcome.error:
+            return 'same', None, None
+        return 'FAIL', outcome.error or 'no error (golden: %s)' % reference.error, None
+    if reference.text == outcome.text:
+        return 'same', None, 0.0
+    header, tail, ref = read_par(reference.text)
+    alt_header, alt_tail, alt = read_par(outcome.text)
+    if (header, tail) != (alt_header, alt_tail):
+        return 'DIFF', 'header', None
+    if sorted(ref) != sorted(alt):
+        return 'DIFF', 'fields', None
+    worst, worst_field = 0.0, None
+    for field in sorted(ref):
+        deviation = abs(alt[field][0] - ref[field][0])
+        allowed = _allowed(ref, field, tolerance)
+        #the values are read back from text, so a deviation within a hair of a unit is that unit
+        share = deviation/allowed if allowed else (float('inf') if deviation > 1e-9 else 0.0)
+        if share > worst + 1e-9:
+            worst, worst_field = share, field
+    if worst > 1 + 1e-9:
+        return 'DIFF', worst_field, worst
+    return 'within', worst_field, worst
+
+
+def _fastest(f, repeat):
+    best = None
+    for i in range(repeat):
+        outcome = f()
+        if best is None or (outcome.seconds < best.seconds and outcome.error == best.error):
+            best = outcome
+    return best
+
+def check(inputs, engines=ENGINES, jobs=2, repeat=1, datadir='equivalence_data', goldendir=GOLDEN):
+    '''Runs each variant over the inputs ((name, file name)) and compares its '.par' with the golden
+    one, returning a record for each run: input, variant, status, worst field, deviation, seconds
+    and speedup (over the rows engine alone)'''
+    cachedir, outdir = os.path.join(datadir, 'cache'), os.path.join(datadir, 'out')
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    records = []
+    for name, fin in inputs:
+        reference = golden(name, goldendir)
+        if reference is None:
+            print "{0: <32} no golden '.par', skipped (see -g)".format(name)
+            continue
+        base = None
+        for variant, engine, cached, parallel in variants(engines):
+            cache = cachedir if cached else None
+            fout = os.path.join(outdir, '%s_%s.par' % (name, variant.replace(' -', '_')))
+            if cached:
+                run(fin, fout, engine, cache) #fills the cache, so the runs timed read from it
+            outcome = _fastest(lambda: run(fin, fout, engine, cache, jobs if parallel else None), repeat)
+            if variant == 'rows':
+                base = outcome.seconds
+            status, field, deviation = compare(reference, outcome, TOLERANCES[engine])
+            record = {'input':name, 'variant':variant, 'status':status, 'field':field, 'deviation':deviation,
+                      'seconds':outcome.seconds, 'speedup':base/outcome.seconds if base and outcome.seconds else None}
+            records.append(record)
+            _print_record(record)
+    return records
+
+def check_failures(inputs, engines=ENGINES, jobs=2, datadir='equivalence_data'):
+    '''Runs each engine that can use worker processes (not columnar) over the failing inputs with
+    and without them, returning a record for each run like check(): same if both stop with the
+    same error'''
+    fout = os.path.join(datadir, 'out', 'failing.par')
+    records = []
+    for name, fin in inputs:
+        for engine in engines:
+            if engine == 'columnar':
+                continue
+            serial, split = run(fin, fout, engine), run(fin, fout, engine, jobs=jobs)
+            if serial.error is not None and split.error == serial.error:
+                status, field = 'same', None
+            else:
+                status, field = 'FAIL', split.error or serial.error or 'no error'
+            record = {'input':name, 'variant':engine + ' -j', 'status':status, 'field':field, 'deviation':None,
+                      'seconds':split.seconds, 'speedup':None}
+            records.append(record)
+            _print_record(record)
+    return records
+
+def _print_record(r):
+    line = "{0: <32} {1: <20} {2: <8} {3: >8.3f} s".format(r['input'], r['variant'], r['status'][:8], r['seconds'])
+    if r.get('speedup') is not None:
+        line += " {0: >7.2f}x".format(r['speedup'])
+    if r.get('field') is not None:
+        line += "  worst: {0} ({1:.3g})".format(r['field'], r['deviation']) if r['deviation'] is not None else "  {0}".format(r['field'])
+    print line
+
+def summary(records):
+    '''Prints the runs of each variant by status and its speedup (geometric mean over the inputs)'''
+    print "{0: <20} {1: >5} {2: >7} {3: >5} {4: >5} {5: >9}".format('variant', 'same', 'within', 'DIFF', 'FAIL', 'speedup')
+    for variant, engine, cached, parallel in variants():
+        runs = [r for r in records if r['variant'] == variant]
+        if not runs:
+            continue
+        counts = [len([r for r in runs if r['status'] == s]) for s in ('same', 'within', 'DIFF', 'FAIL')]
+        speedups = [r['speedup'] for r in runs if r['speedup']]
+        speedup = float(np.exp(np.mean(np.log(speedups)))) if speedups else 0
+        print "{0: <20} {1[0]: >5} {1[1]: >7} {1[2]: >5} {1[3]: >5} {2: >8.2f}x".format(variant, counts, speedup)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Checks the CliPar engines write the same \'.par\' as the original loop on synthetic and edge case records')
+    parser.add_argument('-y', '--years', type=int, nargs='+', default=[1, 3], help='Years of the synthetic records (default: 1 3)')
+    parser.add_argument('-s', '--seeds', type=int, nargs='+', default=[0], help='Random seeds of the corpus (default: 0)')
+    parser.add_argument('-e', '--engines', nargs='+', choices=ENGINES, default=list(ENGINES), help='Engines to check (default: all)')
+    parser.add_argument('-c', '--cases', nargs='+', choices=EDGE_CASES, default=list(EDGE_CASES), help='Edge cases in the corpus (default: all)')
+    parser.add_argument('-j', '--jobs', type=int, default=2, help='Worker processes of the -j variants (default: 2)')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='Runs of each, keeping the fastest (default: 1)')
+    parser.add_argument('-d', '--data', default='equivalence_data', help='Directory for the corpus, the input cache and the \'.par\' written (default: equivalence_data)')
+    parser.add_argument('-G', '--golden', default=GOLDEN, help='Directory of the golden \'.par\' files (default: golden next to this script)')
+    parser.add_argument('-g', '--golden-from', help='CliPar.py of the original loop to write the golden \'.par\' files with, instead of checking')
+    parser.add_argument('-o', '--output', help='Results file name (\'*.json\')')
+    args = parser.parse_args(argv)
+    if [y for y in args.years if not 1 <= y <= 100]:
+        parser.error('--years must be from 1 to 100')
+    if args.jobs < 1 or args.repeat < 1:
+        parser.error('--jobs and --repeat must be at least 1')
+
+    inputs = corpus(args.data, args.years, args.seeds, args.cases)
+    if args.golden_from:
+        write_goldens(inputs, args.golden_from, args.golden)
+        return
+    records = check(inputs, args.engines, args.jobs, args.repeat, args.data, args.golden)
+    records += check_failures(failing_corpus(args.data, args.seeds), args.engines, args.jobs, args.data)
+    summary(records)
+    if args.output:
+        with open(args.output, 'w') as o:
+            json.dump({'created':time.strftime('%Y-%m-%dT%H:%M:%S'), 'numpy':np.__version__, 'tolerances':TOLERANCES,
+                       'runs':records}, o, indent=1, sort_keys=True)
+        print "Results written to {0}".format(args.output)
+    failed = [r for r in records if r['status'] in ('DIFF', 'FAIL')]
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+import argparse, json, os, signal, sys, threading, time
+import multiprocessing
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import OrderedDict, deque
+
+import numpy as np
+
+import CliPar
+
+'''
+Serves '.par' files on demand from a long running process, so a web front end doesn't pay for the
+python startup, the numpy import and the parse of the '.csv' on every request.
+
+A local HTTP server (localhost only by default) takes generation jobs as JSON and runs the
+columnar engine over a pool of worker processes. It keeps two bounded least recently used caches:
+- the '.par' of each station, in the server, by input file (its path, size and modified time) and
+  options, so a repeated request is answered without going to a worker
+- the parsed columns of each input, in each worker, so a station asked for again (eg. with another
+  name) isn't parsed again; with -c they're also memory mapped from the columnar input cache, which
+  all the workers share
+Requests for a '.par' already being worked out wait for that job rather than starting another.
+
+Requests:
+POST /par       {"input": "station.csv", "station": "NAME", "interval": 15, "output": "station.par"}
+                as application/json; only input is needed: station (a name on a single line)
+                defaults to the input's name, interval to the detected one, and output to none. The
+                server only writes output (a path in its output directory, -o) if it was started
+                with one. Answers {"station", "par" (the '.par' text), "cached", "seconds"}, or
+                {"error"} with status 400 for a bad request, 403 for an output outside the output
+                directory or a request from another origin (a web page), 404 for a missing input,
+                415 for a body that isn't JSON, 422 for a record a '.par' can't be made from or 500
+GET /metrics    jobs waiting for a worker (queue depth) and running, request and error counts, cache
+                hits and misses, and the latency (s) of the recent requests: mean, 50th, 95th and
+                99th percentiles and max
+GET /health     {"status": "ok"}
+
+Usage:
+python server.py -p 8642 -w 4 -n 64 -c cache_dir -C catalog.csv -o par_dir
+'''
+
+
+LATENCY_WINDOW = 1000 #recent requests the latency metrics are worked out from
+PERCENTILES = (50, 95, 99)
+
+
+class LRUCache(object):
+    '''Bounded least recently used cache: holds up to size values, dropping the one used longest ago
+    to make room. Not thread safe on its own.'''
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''The value of key, None if it isn't held'''
+        if key not in self.items:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = self.items.pop(key)
+        self.items[key] = value
+        return value
+
+    def put(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+    def stats(self):
+        return {'size':len(self.items), 'capacity':self.size, 'hits':self.hits, 'misses':self.misses}
+
+
+def input_key(fin):
+    '''Identity of the input file fin as it is now: its absolute path, size and modified time'''
+    st = os.stat(fin)
+    return (os.path.abspath(fin), st.st_size, st.st_mtime)
+
+
+#worker process state, set by _init
+_columns = None
+_cachedir = None
+_catalog = None
+_started = None
+
+def _init(columns, cachedir, catalog, started):
+    global _columns, _cachedir, _catalog, _started
+    _columns = LRUCache(columns)
+    _cachedir = cachedir
+    _catalog = CliPar.load_catalog(catalog) if catalog else None
+    _started = started
+
+def _par_job(job):
+    '''Worker: the '.par' text of a station and whether its columns were already parsed'''
+    key, fin, station, interval = job
+    with _started.get_lock():
+        _started.value += 1
+    cols = _columns.get((key, interval))
+    warm = cols is not None
+    if not warm:
+        cols = CliPar.load_columns(fin, _cachedir, interval)
+        _columns.put((key, interval), cols)
+    acc = CliPar.accumulate_columns(cols, (CliPar.storm_gap(interval),), interval)
+    params = CliPar.compute_params(acc, station, _catalog)
+    return CliPar.par_text(params), warm
+
+
+class _Pending(object):
+    #a '.par' being worked out, for all the requests waiting on it (an AsyncResult only wakes one)
+    def __init__(self):
+        self.done = threading.Event()
+        self.text = None
+        self.error = None
+
+
+class ParService(object):
+    '''The '.par' jobs of a server: the cache of '.par' texts, the worker pool and the metrics.
+    par() can be called from any number of request threads.'''
+
+    def __init__(self, workers=None, size=64, columns=8, cachedir=None, catalog=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.started = multiprocessing.Value('l', 0)
+        self.pool = multiprocessing.Pool(self.workers, _init, (columns, cachedir, catalog, self.started))
+        self.lock = threading.Lock()
+        self.pars = LRUCache(size)
+        self.pending = {} #_Pending of each '.par' being worked out, by key
+        self.submitted = 0
+        self.finished = 0
+        self.requests = 0
+        self.errors = 0
+        self.parse_hits = 0
+        self.parse_misses = 0
+        self.latency = deque(maxlen=LATENCY_WINDOW)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def par(self, fin, station=None, interval=None):
+        '''The '.par' text for the input fin, and whether it came from the cache'''
+        key = input_key(fin)
+        if interval is None:
+            interval = CliPar.detect_interval(fin)
+        if station is None:
+            station = CliPar.station_name_of(fin)
+        cache_key = (key, station, interval)
+        with self.lock:
+            text = self.pars.get(cache_key)
+            if text is not None:
+                return text, True
+            job = self.pending.get(cache_key)
+            owner = job is None
+            if owner:
+                job = self.pending[cache_key] = _Pending()
+                self.submitted += 1
+        if owner:
+            try:
+                job.text, warm = self.pool.apply_async(_par_job, ((key, fin, station, interval),)).get()
+            except Exception as e:
+                job.error = e
+            with self.lock:
+                self.pending.pop(cache_key, None)
+                self.finished += 1
+                if job.error is None:
+                    self.pars.put(cache_key, job.text)
+                    if warm:
+                        self.parse_hits += 1
+                    else:
+                        self.parse_misses += 1
+            job.done.set()
+        else:
+            job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.text, False
+
+    def record(self, seconds, error=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += bool(error)
+            self.latency.append(seconds)
+
+    def metrics(self):
+        with self.lock:
+            started = self.started.value
+            latency = np.array(self.latency)
+            metrics = {'workers':self.workers, 'queue_depth':self.submitted - started, 'running':started - self.finished,
+                       'jobs':self.finished, 'requests':self.requests, 'errors':self.errors, 'par_cache':self.pars.stats(),
+                       'parse_cache':{'hits':self.parse_hits, 'misses':self.parse_misses}}
+        if len(latency):
+            metrics['latency'] = dict([('count', len(latency)), ('mean', float(latency.mean())), ('max', float(latency.max()))] +
+                                      [('p%d' % p, float(np.percentile(latency, p))) for p in PERCENTILES])
+        else:
+            metrics['latency'] = None
+        return metrics
+
+
+class ParHandler(BaseHTTPRequestHandler):
+    '''Requests to a ParServer (see the module docstring)'''
+
+    def _send(self, status, body):
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send(200, self.server.service.metrics())
+        elif self.path == '/health':
+            self._send(200, {'status':'ok'})
+        else:
+            self._send(404, {'error':'no such path %s' % self.path})
+
+    def do_POST(self):
+        if self.path != '/par':
+            self._send(404, {'error':'no such path %s' % self.path})
+            return
+        service = self.server.service
+        start = time.time()
+        status = 200
+        try:
+            #a web page can post a form to localhost, but only as another origin and not as JSON
+            origin = self.headers.get('Origin')
+            if origin is not None and origin not in self.server.origins:
+                status = 403
+                raise ValueError('requests from %s are not allowed' % origin)
+            if (self.headers.get('Content-Type') or '').split(';')[0].strip().lower() != 'application/json':
+                status = 415
+                raise ValueError('a job must be sent as application/json')
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+            if not isinstance(job, dict) or not job.get('input'):
+                raise ValueError('a job needs an input')
+            fin = job['input']
+            if not os.path.isfile(fin):
+                status = 404
+                raise ValueError('no such input %s' % fin)
+            interval = job.get('interval')
+            if interval is not None and not (isinstance(interval, int) and not isinstance(interval, bool) and 1 <= interval <= 60):
+                raise ValueError('the interval must be from 1 to 60 minutes')
+            station = job.get('station')
+            #the station goes in the cache key and in the '.par' header's first line
+            if station is not None and not (isinstance(station, basestring) and station.strip() and '\n' not in station and '\r' not in station):
+                raise ValueError('the station must be a name on a single line')
+            output = job.get('output')
+            if output is not None:
+                output = self.server.output_path(output)
+                if output is None:
+                    status = 403
+                    if self.server.outdir is None:
+                        raise ValueError('the server writes no output (it has no output directory)')
+                    raise ValueError('output %s is not in the output directory' % job['output'])
+        except ValueError as e:
+            service.record(time.time() - start, True)
+            self._send(status if status != 200 else 400, {'error':str(e)})
+            return
+        try:
+            text, cached = service.par(fin, station, interval)
+            if output is not None:
+                with open(output, 'w') as o:
+                    o.write(text)
+        except Exception as e:
+            #a record a '.par' can't be made from, or the server's own failure
+            service.record(time.time() - start, True)
+            status = 422 if isinstance(e, (ValueError, IOError, OSError)) else 500
+            self._send(status, {'error':'%s: %s' % (type(e).__name__, e)})
+            return
+        seconds = time.time() - start
+        service.record(seconds)
+        self._send(200, {'station':station or CliPar.station_name_of(fin), 'par':text, 'cached':cached, 'seconds':seconds})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ParServer(ThreadingMixIn, HTTPServer):
+    '''HTTP server answering each request in its own thread, with the ParService shared by them.
+    It writes the '.par' files asked for only under outdir, and takes requests from its own origin
+    or none.'''
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False, outdir=None):
+        HTTPServer.__init__(self, address, ParHandler)
+        self.service = service
+        self.verbose = verbose
+        self.outdir = os.path.realpath(outdir) if outdir else None
+        host, port = self.server_address[:2]
+        hosts = [address[0] or host] + (['localhost', '127.0.0.1'] if host.startswith('127.') else [])
+        self.origins = set('http://%s:%d' % (h, port) for h in hosts)
+
+    def output_path(self, output):
+        '''The full path of the output file name of a job, None if it isn't in outdir (or there's
+        no outdir)'''
+        if self.outdir is None or not isinstance(output, basestring) or not output:
+            return None
+        path = os.path.realpath(os.path.join(self.outdir, output))
+        if not path.startswith(os.path.join(self.outdir, '')):
+            return None
+        return path
+
+
+def serve(host='127.0.0.1', port=8642, workers=None, size=64, columns=8, cachedir=None, catalog=None, verbose=False, outdir=None):
+    '''Runs the server until it's interrupted or terminated'''
+    service = ParService(workers, size, columns, cachedir, catalog)
+    server = ParServer((host, port), service, verbose, outdir)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0)) #after the workers start, they keep the default
+    print "Serving '.par' files on http://{0}:{1} with {2} workers".format(host, server.server_address[1], service.workers)
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serves CliPar \'.par\' files on demand over local HTTP')
+    parser.add_argument('-H', '--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1, this machine only)')
+    parser.add_argument('-p', '--port', type=int, default=8642, help='Port to listen on (default: 8642)')
+    parser.add_argument('-w', '--workers', type=int, help='Number of worker processes (default: one per cpu)')
+    parser.add_argument('-n', '--size', type=int, default=64, help='\'.par\' files kept in the cache (default: 64)')
+    parser.add_argument('-k', '--columns', type=int, default=8, help='Parsed inputs kept by each worker (default: 8)')
+    parser.add_argument('-c', '--cache', help='Directory to cache the parsed input columns in, shared by the workers')
+    parser.add_argument('-C', '--catalog', help='Station catalog file name (\'*.csv\') for the \'*.par\' header and interpolated sections')
+    parser.add_argument('-o', '--outdir', help='Directory the jobs can write their \'*.par\' to (default: none, the jobs only get the text)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log each request')
+    args = parser.parse_args(argv)
+    if args.size < 1 or args.columns < 1:
+        parser.error('--size and --columns must be at least 1')
+    if args.outdir and not os.path.isdir(args.outdir):
+        parser.error('--outdir must be an existing directory')
+    serve(args.host, args.port, args.workers, args.size, args.columns, args.cache, args.catalog, args.verbose, args.outdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import argparse, datetime
+
+import numpy as np
+from math import pi
+
+'''
+Writes synthetic 15 minute climate data in the CliPar input layout, for benchmarks and tests
+
+Output ('.csv'):
+datetime,temp,humid,srad,ws,prcp,wdir
+mm/dd/yyyy hh:mm    deg C    percent    W/m2    m/s   mm      degrees from N
+
+The record is deterministic for a given seed and number of years: the same arguments always give
+the same file. Each year has
+- temperature with a seasonal and daily cycle and day to day weather swings
+- storms (more of them in winter) of 15 minutes to a day or so, with dry spells inside them, as
+  0.254 mm tipping bucket tips
+- humidity that follows the temperature and goes up when it rains, and solar radiation from the
+  sun's elevation at 46.7 N, cut by cloud on stormy days
+- wind speeds (some calm) and directions from a prevailing south west wind and a spread of others
+- a few gaps, where the logger was down for an hour to a few days and there are no records
+- missing fields, left blank
+
+Usage:
+python synthetic.py -y 10 -o synthetic.csv
+'''
+
+
+HEADER = 'datetime,temp,humid,srad,ws,prcp,wdir\n'
+LATITUDE = 46.7 #deg N, for the solar radiation
+TIP = 0.254 #mm of precip in one tip of the bucket
+STEPS = 96 #15 minute time steps in a day
+
+
+def _times():
+    #the time part of the datetime for each step of a day
+    return ['%d:%02d' % (s//4, 15*(s % 4)) for s in range(STEPS)]
+
+def _daily_anomaly(rng, ndays, sd=3.0, keep=0.7):
+    #day to day temperature swings, AR(1)
+    noise = rng.normal(0.0, sd*np.sqrt(1 - keep**2), ndays)
+    out = np.empty(ndays)
+    value = rng.normal(0.0, sd)
+    for i in range(ndays):
+        value = keep*value + noise[i]
+        out[i] = value
+    return out
+
+def _storms(rng, nsteps, doy):
+    '''Precip (mm) for each step: storms arrive more often in winter, each with a random length,
+    peak and shape, and some dry steps inside it'''
+    p = np.zeros(nsteps)
+    rate = (0.3 + 0.15*np.cos(2*pi*(doy - 15)/365.25))/STEPS #storms per step
+    starts = np.flatnonzero(rng.random_sample(nsteps) < rate)
+    for start in starts:
+        length = min(1 + rng.geometric(1/10.0), nsteps - start)
+        peak = rng.exponential(1.5)
+        shape = 1 - np.abs(np.linspace(-1, 1, length + 2)[1:-1] - rng.uniform(-0.5, 0.5))
+        storm = peak*np.clip(shape, 0.05, 1)*rng.exponential(1.0, length)
+        storm[rng.random_sample(length) < 0.2] = 0.0
+        p[start:start + length] += storm
+    #tips of the bucket, rounded at random so the totals are kept on average
+    return np.floor(p/TIP + rng.random_sample(nsteps))*TIP
+
+def _srad(doy, hour, cloud):
+    #W/m2 from the sun's elevation
+    decl = np.radians(23.44)*np.sin(2*pi*(284 + doy)/365.0)
+    lat = np.radians(LATITUDE)
+    angle = np.radians(15.0*(hour - 12))
+    elev = np.sin(lat)*np.sin(decl) + np.cos(lat)*np.cos(decl)*np.cos(angle)
+    return np.maximum(0.0, 1000.0*elev)*cloud
+
+def _column(values, fmt, blank):
+    return ['' if b else fmt % v for v, b in zip(values, blank)]
+
+def _year(rng, year, gaps, missing):
+    '''The lines of the '.csv' for one calendar year'''
+    first = datetime.date(year, 1, 1)
+    ndays = (datetime.date(year + 1, 1, 1) - first).days
+    dates = [first + datetime.timedelta(days=i) for i in range(ndays)]
+    nsteps = ndays*STEPS
+    day = np.repeat(np.arange(ndays), STEPS)
+    doy = day + 1.0
+    hour = np.tile(np.arange(STEPS)/4.0, ndays)
+    season = np.cos(2*pi*(doy - 200)/365.25) #1 in mid July, -1 in mid January
+
+    prcp = _storms(rng, nsteps, doy)
+    raining = np.convolve(prcp > 0, np.ones(8), 'same') > 0 #within an hour of a tip
+    stormy = np.bincount(day, prcp, ndays)[day] > 2.0
+
+    temp = 8 + 12*season + 6*np.sin(2*pi*(hour - 9)/24) + _daily_anomaly(rng, ndays)[day] - 2*stormy
+    temp += rng.normal(0, 0.3, nsteps)
+    humid = 65 - 15*season - 15*np.sin(2*pi*(hour - 9)/24) + rng.normal(0, 5, nsteps)
+    humid[raining] = rng.uniform(88, 100, raining.sum())
+    humid = np.clip(np.round(humid), 5, 100)
+    cloud = np.where(stormy, rng.uniform(0.2, 0.5, ndays)[day], rng.uniform(0.75, 1.0, ndays)[day])
+    srad = _srad(doy, hour, cloud)
+    ws = rng.gamma(2.0, 1.2, nsteps)*(1 + 0.3*np.sin(2*pi*(hour - 10)/24))
+    prevailing = rng.random_sample(nsteps) < 0.6
+    wdir = np.where(prevailing, np.degrees(rng.vonmises(np.radians(240), 2.0, nsteps)), rng.uniform(0, 360, nsteps)) % 360
+
+    #logger down, from an hour to a few days
+    keep = np.ones(nsteps, dtype=bool)
+    for start in rng.randint(0, nsteps, rng.poisson(gaps)):
+        keep[start:start + int(min(4 + rng.exponential(STEPS), 10*STEPS))] = False
+
+    times = _times()
+    stamps = ['%d/%d/%d %s' % (dates[i // STEPS].month, dates[i // STEPS].day, year, times[i % STEPS]) for i in np.flatnonzero(keep)]
+    fields = []
+    for values, fmt, rate in ((temp, '%.1f', missing), (humid, '%.0f', missing), (srad, '%.1f', missing),
+                              (ws, '%.1f', missing), (prcp, '%.3f', missing), (wdir, '%.1f', 2*missing)):
+        blank = rng.random_sample(nsteps) < rate
+        fields.append(_column(values[keep], fmt, blank[keep]))
+    return [','.join(row) + '\n' for row in zip(stamps, *fields)]
+
+def generate(fout, years=1, seed=0, start_year=2000, gaps=3, missing=0.002):
+    '''Writes `years` years of synthetic 15 minute climate data, starting on January 1 of start_year,
+    to the '.csv' fout (a file name or an open file). gaps is the average number of logger gaps in a
+    year and missing the chance of each field being blank. Returns the number of records written.'''
+    if years < 1:
+        raise ValueError('years must be at least 1, not %d' % years)
+    if isinstance(fout, basestring):
+        with open(fout, 'wb') as o:
+            return generate(o, years, seed, start_year, gaps, missing)
+    rng = np.random.RandomState(seed)
+    fout.write(HEADER)
+    rows = 0
+    for year in range(start_year, start_year + years):
+        lines = _year(rng, year, gaps, missing)
+        fout.writelines(lines)
+        rows += len(lines)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Writes synthetic 15 minute climate data (\'*.csv\')')
+    parser.add_argument('-o', '--output', required=True, help='Output climate data file name (\'*.csv\')')
+    parser.add_argument('-y', '--years', type=int, default=1, help='Years of record (default: 1)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--start', type=int, default=2000, help='First year (default: 2000)')
+    parser.add_argument('--gaps', type=float, default=3, help='Average number of logger gaps a year (default: 3)')
+    parser.add_argument('--missing', type=float, default=0.002, help='Chance of a field being blank (default: 0.002)')
+    args = parser.parse_args(argv)
+    rows = generate(args.output, args.years, args.seed, args.start, args.gaps, args.missing)
+    print "{0} records written to {1}".format(rows, args.output)
+
+
+if __name__ == "__main__":
+    main()